@@ -0,0 +1,137 @@
+"""Load test dashboard sessions reading a snapshot store while another process syncs.
+
+Simulated sessions, each with its own cursor, query `get_transactions` and
+`get_metrics` in a loop, while a separate writer process runs incremental syncs
+against a local Up stub, swapping in a new generation after each. Reports the p50
+and p99 latency of each query and any errors, exiting with 1 if a session hit an
+error.
+
+Usage:
+    PYTHONPATH=entrypoint uv run python benchmarks/bench_concurrency.py
+    PYTHONPATH=entrypoint uv run python benchmarks/bench_concurrency.py --sessions 16
+"""
+
+import argparse
+import datetime
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+from sources.snapshots import SnapshotStore
+from sources.upbank import BudgetDataUp, UpbankClient
+from upbank_stub import UpStub
+
+# New transactions the stub gets before each sync.
+SYNC_TRANSACTIONS = 10
+# Wide enough to cover every synthesized transaction.
+FILTERS = {
+    "start_date": datetime.date(2000, 1, 1),
+    "end_date": datetime.date(2100, 1, 1),
+}
+
+
+def sync_until(directory: Path, transactions: int, latency: float, deadline: float) -> int:
+    """Sync from a stub into the store until the deadline, returning the syncs run.
+
+    At least one sync runs, and the first sync into an empty store is a full
+    refresh. The stub gets new transactions before each sync, as a sync that
+    changes nothing doesn't swap in a generation. The stub runs in the writer's
+    process, so the sessions don't slow its responses.
+    """
+    with UpStub(transactions, latency) as stub:
+        client = UpbankClient("token", base_url=stub.url)
+        budget_data = BudgetDataUp(client, SnapshotStore(directory))
+        syncs = 0
+        while syncs == 0 or time.time() < deadline:
+            stub.add_transactions(SYNC_TRANSACTIONS)
+            budget_data.refresh_transactions()
+            syncs += 1
+        budget_data.close()
+        client.close()
+    return syncs
+
+
+def session(
+    budget_data: BudgetDataUp,
+    deadline: float,
+    latencies: dict[str, list[float]],
+    errors: Counter,
+) -> None:
+    """Query the transactions and metrics in a loop until the deadline."""
+    cursor = budget_data.cursor()
+    queries = {
+        "get_transactions": lambda: cursor.get_transactions(**FILTERS),
+        "get_metrics": lambda: cursor.get_metrics(**FILTERS),
+    }
+    while time.time() < deadline:
+        for name, query in queries.items():
+            start = time.perf_counter()
+            try:
+                query()
+            except Exception as e:
+                errors[f"{name}: {type(e).__name__}: {e}"] += 1
+                continue
+            latencies[name].append((time.perf_counter() - start) * 1000)
+    cursor.close()
+
+
+def percentile(values: list[float], q: int) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+def main(sessions: int, seconds: float, transactions: int, latency: float) -> int:
+    with (
+        tempfile.TemporaryDirectory() as tmp,
+        ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool,
+    ):
+        directory = Path(tmp) / "snapshots"
+        # Load the first generation before the sessions start.
+        pool.submit(sync_until, directory, transactions, latency, 0).result()
+        budget_data = BudgetDataUp(UpbankClient("token"), SnapshotStore(directory))
+        first_generation = budget_data.generation
+
+        deadline = time.time() + seconds
+        latencies = {"get_transactions": [], "get_metrics": []}
+        errors = Counter()
+        threads = [threading.Thread(target=session, args=(budget_data, deadline, latencies, errors)) for _ in range(sessions)]
+        syncs = pool.submit(sync_until, directory, transactions, latency, deadline)
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        syncs = syncs.result()
+        generations = budget_data.generation - first_generation
+        budget_data.close()
+
+    print(f"{sessions} sessions for {seconds:.0f}s over {transactions} transactions, {syncs} syncs and {generations} generations swapped in")
+    print(f"{'query':>17} {'calls':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, values in latencies.items():
+        if not values:
+            print(f"{name:>17} {0:>7}")
+            continue
+        print(f"{name:>17} {len(values):>7} {percentile(values, 50):>8.2f} {percentile(values, 99):>8.2f} {max(values):>8.2f}")
+    print(f"{'errors':>17} {sum(errors.values()):>7}")
+    for error, count in errors.most_common():
+        print(f"    {count} x {error}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--transactions", type=int, default=20_000)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="seconds the stub waits before each response",
+    )
+    args = parser.parse_args()
+    sys.exit(main(args.sessions, args.seconds, args.transactions, args.latency))
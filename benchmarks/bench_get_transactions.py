@@ -0,0 +1,89 @@
+"""Benchmark the per call latency of `BudgetDataUp.get_transactions`.
+
+Compares the prepared, parameterized query against the previous approach of
+formatting the filters into a new SQL string on every call.
+
+Usage:
+    PYTHONPATH=entrypoint uv run python benchmarks/bench_get_transactions.py
+"""
+
+import argparse
+import datetime
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+from sources.upbank import BudgetDataUp, UpbankClient
+from upbank_stub import UpStub
+
+
+def formatted_query(budget_data: BudgetDataUp, start_date, end_date, account):
+    """`get_transactions` as it was written before the query was prepared."""
+    included_accounts = [account] if account else budget_data.get_accounts()
+    return (
+        budget_data.conn.sql(
+            f"""
+            select
+                id,
+                created_date,
+                type,
+                description,
+                category,
+                subcategory,
+                abs(amount_cents) / 100 as amount,
+                account,
+                status
+            from named_transactions
+            where
+                created_date between '{start_date}' and '{end_date}' and
+                category is not null and
+                category not in ('') and
+                subcategory not in ('') and
+                account in ('{"','".join(included_accounts)}')
+            order by
+                created_date desc
+        """
+        )
+        .arrow()
+        # Built the same way as `get_transactions`, so only the query is compared.
+        .to_pandas(types_mapper=pd.ArrowDtype)
+    )
+
+
+def prepared_query(budget_data: BudgetDataUp, start_date, end_date, account):
+    return budget_data.get_transactions(start_date, end_date, account, validate_transactions=False)
+
+
+def time_calls(query, budget_data: BudgetDataUp, calls: int) -> list[float]:
+    end_date = datetime.date.today()
+    timings = []
+    for i in range(calls):
+        # Alternate the filters, like a user changing the sidebar between reruns.
+        start_date = end_date - datetime.timedelta(days=30 + i % 2)
+        start = time.perf_counter()
+        query(budget_data, start_date, end_date, ["Spending", None][i % 2])
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main(transactions: int, calls: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp, UpStub(transactions) as stub:
+        client = UpbankClient("token", base_url=stub.url)
+        budget_data = BudgetDataUp(client, Path(tmp) / "db.duckdb")
+        budget_data.refresh_transactions(full_refresh=True)
+        print(f"{'query':>10} {'p50 ms':>8} {'p99 ms':>8}")
+        queries = {"formatted": formatted_query, "prepared": prepared_query}
+        for name, query in queries.items():
+            timings = time_calls(query, budget_data, calls)
+            p99 = statistics.quantiles(timings, n=100)[98]
+            print(f"{name:>10} {statistics.median(timings):>8.2f} {p99:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transactions", type=int, default=20_000)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+    main(args.transactions, args.calls)
@@ -0,0 +1,41 @@
+"""Benchmark parallel date window fetching in `UpbankClient.transactions`.
+
+Fetches a year of transactions from a local Up API stub with 1, 4 and 8 workers.
+
+Usage:
+    PYTHONPATH=entrypoint uv run python benchmarks/bench_parallel_fetch.py
+"""
+
+import argparse
+import datetime
+import time
+
+from sources.upbank import HIST_DATA_LOAD_DAYS, UpbankClient
+from upbank_stub import UpStub
+
+
+def main(transactions: int, latency: float, workers: list[int]) -> None:
+    with UpStub(transactions, latency=latency) as stub:
+        client = UpbankClient("token", base_url=stub.url)
+        until = datetime.datetime.now().astimezone() + datetime.timedelta(minutes=1)
+        since = until - datetime.timedelta(days=HIST_DATA_LOAD_DAYS + 1)
+        baseline = None
+        print(f"{'workers':>8} {'seconds':>8} {'requests':>9} {'rows':>7} speedup")
+        for n in workers:
+            requests_before = stub.requests
+            start = time.perf_counter()
+            pages = client.transactions(since, until, windows=n, max_workers=n)
+            rows = [row for page in pages for row in page]
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            assert len(rows) == len({row["id"] for row in rows}) == transactions
+            print(f"{n:>8} {elapsed:>8.2f} {stub.requests - requests_before:>9} {len(rows):>7} {baseline / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transactions", type=int, default=20_000)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+    main(args.transactions, args.latency, args.workers)
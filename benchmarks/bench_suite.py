@@ -0,0 +1,237 @@
+"""Benchmark the budget data sources and page computations at several data sizes.
+
+Runs the data source queries and the pandas page computations against
+`BudgetDataMock` and a duckdb backed `BudgetDataUp`, holding a year of 10k, 100k
+and 1M transactions. Everything runs offline: the Up transactions are
+synthesized and loaded straight into duckdb.
+
+The results are saved as JSON and compared with a saved baseline, failing when a
+benchmark is slower than the baseline by more than the threshold, or when there
+is no baseline to compare with. Timings depend on the machine, so the baseline
+is machine-local and not committed: save one with `make bench-baseline` before
+making a change, then compare with `make bench`.
+
+Usage:
+    PYTHONPATH=entrypoint uv run python benchmarks/bench_suite.py
+    PYTHONPATH=entrypoint uv run python benchmarks/bench_suite.py --save-baseline
+"""
+
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+
+from config import BudgetData, BudgetPeriod
+from metrics import (
+    calculate_budget_metrics,
+    calculate_period_spend,
+    calculate_rolling_trend,
+)
+from sources.mockdata import BudgetDataMock
+from sources.upbank import BudgetDataUp, UpbankClient
+from upbank_stub import (
+    synthesize_accounts,
+    synthesize_categories,
+    synthesize_transactions,
+)
+
+RESULTS_DIR = Path(__file__).parent / "results"
+SIZES = [10_000, 100_000, 1_000_000]
+SOURCES = ["mock", "up"]
+# The year of transactions every source holds, and the filters queried.
+START_DATE = datetime.date(2024, 1, 1)
+END_DATE = datetime.date(2024, 12, 31)
+FILTERS = {"start_date": START_DATE, "end_date": END_DATE}
+# Transactions synthesized and loaded into duckdb at a time.
+LOAD_BATCH_SIZE = 50_000
+# Each benchmark is repeated until it has run for this long, within the bounds.
+MIN_SECONDS = 0.5
+MIN_RUNS = 3
+MAX_RUNS = 50
+
+
+def mock_source(size: int, tmp: Path) -> BudgetData:
+    """A mock source generating about `size` transactions over the year."""
+    per_day = max(size // 366, 1)
+    budget_data = BudgetDataMock(transactions_per_day=(per_day, per_day))
+    budget_data.get_transactions(**FILTERS)
+    return budget_data
+
+
+def up_source(size: int, tmp: Path) -> BudgetData:
+    """An Up source with `size` synthetic transactions loaded into duckdb."""
+    budget_data = BudgetDataUp(UpbankClient("token"), tmp / f"up_{size}.duckdb")
+    end = datetime.datetime.combine(END_DATE, datetime.time.max, tzinfo=datetime.UTC)
+    days = (END_DATE - START_DATE).days + 1
+    budget_data._create_transactions_table()
+    budget_data._load_accounts(synthesize_accounts([]))
+    budget_data._load_categories(synthesize_categories())
+    for offset in range(0, size, LOAD_BATCH_SIZE):
+        count = min(LOAD_BATCH_SIZE, size - offset)
+        budget_data._upsert_transactions(
+            synthesize_transactions(
+                count,
+                end - datetime.timedelta(days=days * offset / size),
+                days=days * count / size,
+                seed=offset,
+            )
+        )
+    return budget_data
+
+
+def benchmarks(budget_data: BudgetData) -> dict[str, Callable]:
+    """The benchmarks to run against a data source, by name."""
+    df = budget_data.get_transactions(**FILTERS)
+    return {
+        "get_transactions": lambda: budget_data.get_transactions(**FILTERS),
+        "get_largest_transactions": lambda: budget_data.get_largest_transactions(**FILTERS),
+        "get_categories": budget_data.get_categories,
+        "get_subcategories": budget_data.get_subcategories,
+        "get_metrics": lambda: budget_data.get_metrics(**FILTERS),
+        "get_rolling_trend": lambda: budget_data.get_rolling_trend(**FILTERS, window_days=30),
+        "get_period_spend": lambda: budget_data.get_period_spend(**FILTERS, period=BudgetPeriod.MONTH),
+        "calculate_budget_metrics": lambda: calculate_budget_metrics(df),
+        "calculate_rolling_trend": lambda: calculate_rolling_trend(df, START_DATE, END_DATE, 30),
+        "calculate_period_spend": lambda: calculate_period_spend(df, BudgetPeriod.MONTH),
+    }
+
+
+def measure(function: Callable) -> dict:
+    """Time repeated calls of function, in milliseconds."""
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < MAX_RUNS and (len(timings) < MIN_RUNS or time.perf_counter() - started < MIN_SECONDS):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": statistics.median(timings),
+        "min_ms": min(timings),
+        "runs": len(timings),
+    }
+
+
+def run(sizes: list[int], sources: list[str]) -> dict:
+    """Run every benchmark for each source and size, keyed `source/size/name`."""
+    factories = {"mock": mock_source, "up": up_source}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for source in sources:
+            for size in sizes:
+                start = time.perf_counter()
+                budget_data = factories[source](size, Path(tmp))
+                setup_ms = (time.perf_counter() - start) * 1000
+                results[f"{source}/{size}/setup"] = {
+                    "median_ms": setup_ms,
+                    "min_ms": setup_ms,
+                    "runs": 1,
+                }
+                for name, function in benchmarks(budget_data).items():
+                    key = f"{source}/{size}/{name}"
+                    results[key] = measure(function)
+                    print(f"{key:<45} {results[key]['median_ms']:>10.2f} ms")
+                budget_data.close()
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> list[str]:
+    """Report each benchmark against the baseline, returning the regressions.
+
+    A benchmark regresses when its median is more than `threshold` slower than
+    the baseline's, and by more than `min_delta_ms`, so noise in the fastest
+    benchmarks isn't reported. Setup is only timed once, so it is reported but
+    never counted as a regression.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<45} {'baseline':>10} {'current':>10} {'change':>8}")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before, after = baseline[key]["median_ms"], result["median_ms"]
+        change = after / before - 1 if before else 0.0
+        regressed = result["runs"] >= MIN_RUNS and change > threshold and after - before > min_delta_ms
+        if regressed:
+            regressions.append(key)
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{key:<45} {before:>10.2f} {after:>10.2f} {change:>+8.0%}{flag}")
+    return regressions
+
+
+def main(
+    sizes: list[int],
+    sources: list[str],
+    output: Path,
+    baseline_path: Path,
+    save_baseline: bool,
+    threshold: float,
+    min_delta_ms: float,
+) -> int:
+    results = run(sizes, sources)
+    report = {
+        "meta": {
+            "created_at": datetime.datetime.now().astimezone().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nSaved results to {output}")
+    if save_baseline:
+        baseline_path.write_text(json.dumps(report, indent=2))
+        print(f"Saved baseline to {baseline_path}")
+        return 0
+    if not baseline_path.exists():
+        # Without a baseline nothing is compared, so don't let the run pass.
+        print(f"\nNo baseline at {baseline_path}, save one with `make bench-baseline`", file=sys.stderr)
+        return 2
+    baseline = json.loads(baseline_path.read_text())["results"]
+    regressions = compare(results, baseline, threshold, min_delta_ms)
+    if regressions:
+        print(f"\n{len(regressions)} benchmarks regressed by over {threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--sources", nargs="+", choices=SOURCES, default=SOURCES)
+    parser.add_argument("--output", type=Path, default=RESULTS_DIR / "latest.json")
+    parser.add_argument("--baseline", type=Path, default=RESULTS_DIR / "baseline.json")
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="save the results as the baseline instead of comparing with it",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="fraction slower than the baseline that counts as a regression",
+    )
+    parser.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=1.0,
+        help="milliseconds slower than the baseline that counts as a regression",
+    )
+    args = parser.parse_args()
+    sys.exit(
+        main(
+            args.sizes,
+            args.sources,
+            args.output,
+            args.baseline,
+            args.save_baseline,
+            args.threshold,
+            args.min_delta_ms,
+        )
+    )
@@ -0,0 +1,104 @@
+"""Benchmark full and incremental syncs of `BudgetDataUp` against a local Up stub.
+
+Each sync runs in a new process, so its peak RSS is its own. Reports rows per
+second, peak RSS and the number of requests the stub answered, including the
+rate limited and failed requests the client retried.
+
+Usage:
+    PYTHONPATH=entrypoint uv run python benchmarks/bench_sync.py
+    PYTHONPATH=entrypoint uv run python benchmarks/bench_sync.py --rate-limit 50
+"""
+
+import argparse
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+from sources.upbank import BudgetDataUp, UpbankClient
+from upbank_stub import UpStub
+
+
+def sync(url: str, database: Path, full_refresh: bool) -> dict:
+    """Refresh the accounts and transactions, returning the sync's measurements."""
+    client = UpbankClient("token", base_url=url)
+    budget_data = BudgetDataUp(client, database)
+    start = time.perf_counter()
+    budget_data.refresh_accounts()
+    rows = budget_data.refresh_transactions(full_refresh=full_refresh)
+    seconds = time.perf_counter() - start
+    budget_data.close()
+    client.close()
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss *= 1 if sys.platform == "darwin" else 1024
+    return {
+        "seconds": seconds,
+        "rows": rows,
+        "retries": client.stats.retries,
+        "pauses": client.stats.rate_limit_pauses,
+        "peak_rss": peak_rss,
+    }
+
+
+def in_new_process(function, *args):
+    """Call function in a new python process and return its result."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(function, *args).result()
+
+
+def main(
+    transactions: int,
+    new_transactions: int,
+    latency: float,
+    rate_limit: float | None,
+    error_rate: float,
+) -> None:
+    with (
+        tempfile.TemporaryDirectory() as tmp,
+        UpStub(
+            transactions,
+            latency=latency,
+            rate_limit=rate_limit,
+            error_rate=error_rate,
+        ) as stub,
+    ):
+        database = Path(tmp) / "db.duckdb"
+        print(f"{'sync':>12} {'seconds':>8} {'rows':>7} {'rows/s':>8} {'requests':>9} {'429s':>5} {'errors':>6} {'retries':>7} {'pauses':>6} {'peak MB':>8}")
+        for name, full_refresh in (("full", True), ("incremental", False)):
+            if not full_refresh:
+                stub.add_transactions(new_transactions)
+            requests, throttled, errors = stub.requests, stub.throttled, stub.errors
+            result = in_new_process(sync, stub.url, database, full_refresh)
+            print(
+                f"{name:>12} {result['seconds']:>8.2f} {result['rows']:>7}"
+                f" {result['rows'] / result['seconds']:>8.0f}"
+                f" {stub.requests - requests:>9} {stub.throttled - throttled:>5}"
+                f" {stub.errors - errors:>6} {result['retries']:>7} {result['pauses']:>6}"
+                f" {result['peak_rss'] / 1024**2:>8.1f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transactions", type=int, default=20_000)
+    parser.add_argument(
+        "--new-transactions",
+        type=int,
+        default=200,
+        help="transactions added to the stub before the incremental sync",
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument("--rate-limit", type=float, default=None, help="requests per second")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests")
+    args = parser.parse_args()
+    main(
+        args.transactions,
+        args.new_transactions,
+        args.latency,
+        args.rate_limit,
+        args.error_rate,
+    )
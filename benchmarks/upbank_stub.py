@@ -0,0 +1,326 @@
+"""Up Bank API stub.
+
+A local stand-in for the Up Bank API, serving deterministic synthetic transactions,
+accounts and categories with the same JSON:API shape and cursor pagination as the
+real API. Latency, rate limiting and server errors can be injected to measure how
+the client copes with them.
+"""
+
+import bisect
+import datetime
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from sources.upbank import EXPENSE_TYPES, INCOME_TYPES, PAGE_SIZE
+
+UP_ACCOUNT_ID = "70f21552-9d8d-48a5-ab54-35d34faf19e9"
+TWOUP_ACCOUNT_ID = "c176950d-d9e3-4918-ad9a-46b9cc4f9b6a"
+
+CATEGORIES = {
+    "good-life": ["restaurants-and-cafes", "takeaway", "pubs-and-bars", "hobbies"],
+    "home": ["groceries", "rent-and-mortgage", "utilities", "internet"],
+    "personal": ["clothing-and-accessories", "health-and-medical", "gifts-and-charity"],
+    "transport": ["fuel", "public-transport", "car-repayments", "parking"],
+}
+
+
+def synthesize_transactions(
+    count: int,
+    end: datetime.datetime,
+    days: int = 366,
+    seed: int = 0,
+    status: str = "SETTLED",
+) -> list[dict]:
+    """Generate Up shaped transactions spread evenly over `days` before `end`.
+
+    Returns:
+        list of transactions, newest first.
+    """
+    rng = random.Random(seed)
+    step = datetime.timedelta(days=days) / max(count, 1)
+    subcategories = [(p, c) for p, children in CATEGORIES.items() for c in children]
+    transactions = []
+    for i in range(count):
+        created_at = (end - step * i).isoformat()
+        transaction_type = rng.choice(EXPENSE_TYPES * 4 + INCOME_TYPES)
+        is_income = transaction_type in INCOME_TYPES
+        cents = rng.randint(100, 400_000 if is_income else 50_000)
+        if not is_income:
+            cents = -cents
+        parent, category = rng.choice(subcategories)
+        transactions.append(
+            {
+                "type": "transactions",
+                "id": str(uuid.UUID(int=rng.getrandbits(128))),
+                "attributes": {
+                    "status": status,
+                    "rawText": None,
+                    "description": f"Merchant {rng.randint(1, 500)}",
+                    "message": None,
+                    "isCategorizable": not is_income,
+                    "amount": {
+                        "currencyCode": "AUD",
+                        "value": f"{cents / 100:.2f}",
+                        "valueInBaseUnits": cents,
+                    },
+                    "settledAt": created_at if status == "SETTLED" else None,
+                    "createdAt": created_at,
+                    "transactionType": transaction_type,
+                },
+                "relationships": {
+                    "account": {
+                        "data": {
+                            "type": "accounts",
+                            "id": rng.choice([UP_ACCOUNT_ID, TWOUP_ACCOUNT_ID]),
+                        }
+                    },
+                    "category": {"data": None if is_income else {"type": "categories", "id": category}},
+                    "parentCategory": {"data": None if is_income else {"type": "categories", "id": parent}},
+                },
+            }
+        )
+    return transactions
+
+
+def synthesize_accounts(transactions: list[dict]) -> list[dict]:
+    """Up shaped accounts, with the balance of their transactions."""
+    balances = dict.fromkeys([UP_ACCOUNT_ID, TWOUP_ACCOUNT_ID], 0)
+    for transaction in transactions:
+        account_id = transaction["relationships"]["account"]["data"]["id"]
+        balances[account_id] += transaction["attributes"]["amount"]["valueInBaseUnits"]
+    ownership = {UP_ACCOUNT_ID: "INDIVIDUAL", TWOUP_ACCOUNT_ID: "JOINT"}
+    names = {UP_ACCOUNT_ID: "Spending", TWOUP_ACCOUNT_ID: "2Up Spending"}
+    return [
+        {
+            "type": "accounts",
+            "id": account_id,
+            "attributes": {
+                "displayName": names[account_id],
+                "accountType": "TRANSACTIONAL",
+                "ownershipType": ownership[account_id],
+                "balance": {
+                    "currencyCode": "AUD",
+                    "value": f"{cents / 100:.2f}",
+                    "valueInBaseUnits": cents,
+                },
+                "createdAt": "2020-01-01T00:00:00+10:00",
+            },
+        }
+        for account_id, cents in balances.items()
+    ]
+
+
+def synthesize_categories() -> list[dict]:
+    """Up shaped categories, parents before their children."""
+
+    def category(category_id: str, parent: str | None, children: list[str]) -> dict:
+        return {
+            "type": "categories",
+            "id": category_id,
+            "attributes": {"name": category_id.replace("-", " ").title()},
+            "relationships": {
+                "parent": {
+                    "data": parent and {"type": "categories", "id": parent},
+                },
+                "children": {
+                    "data": [{"type": "categories", "id": c} for c in children],
+                },
+            },
+        }
+
+    categories = [category(p, None, children) for p, children in CATEGORIES.items()]
+    for parent, children in CATEGORIES.items():
+        categories.extend(category(c, parent, []) for c in children)
+    return categories
+
+
+class UpStub:
+    """Serve the synthetic Up API over HTTP on a background thread.
+
+    Args:
+        transactions: number of transactions to synthesize.
+        latency: seconds to sleep before answering each request.
+        seed: seed for the synthetic transactions and injected errors.
+        rate_limit: requests per second allowed before answering 429, in bursts
+            of up to a second's requests; or None for no limit.
+        retry_after: seconds sent in the `Retry-After` header of a 429; or None
+            to leave the client to back off.
+        error_rate: fraction of requests answered with a 500, 502 or 503.
+    """
+
+    def __init__(
+        self,
+        transactions: int,
+        latency: float = 0.0,
+        seed: int = 0,
+        rate_limit: float | None = None,
+        retry_after: int | None = None,
+        error_rate: float = 0.0,
+    ):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.transactions = synthesize_transactions(transactions, datetime.datetime.now().astimezone(), seed=seed)
+        self.categories = synthesize_categories()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = rate_limit or 0.0
+        self._refilled_at = time.monotonic()
+        self._index_transactions()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_transactions(self, count: int, days: int = 1, status: str = "SETTLED") -> None:
+        """Synthesize more transactions over the last `days`, as new activity."""
+        self.transactions.extend(
+            synthesize_transactions(
+                count,
+                datetime.datetime.now().astimezone(),
+                days=days,
+                seed=len(self.transactions),
+                status=status,
+            )
+        )
+        self._index_transactions()
+
+    def _index_transactions(self) -> None:
+        """Index the transactions and recalculate the account balances."""
+        # Views of the transactions by account and status, keyed by None for all
+        # accounts or statuses, with negated timestamps so the newest first lists
+        # can be bisected.
+        index = {}
+        for transaction in self.transactions:
+            account_id = transaction["relationships"]["account"]["data"]["id"]
+            status = transaction["attributes"]["status"]
+            created_at = datetime.datetime.fromisoformat(transaction["attributes"]["createdAt"])
+            for key in itertools.product((None, account_id), (None, status)):
+                index.setdefault(key, []).append((-created_at.timestamp(), transaction))
+        for key, entries in index.items():
+            entries.sort(key=lambda entry: entry[0])
+            index[key] = ([k for k, _ in entries], [row for _, row in entries])
+        with self._lock:
+            self._index = index
+            self.accounts = synthesize_accounts(self.transactions)
+
+    def _admit(self) -> tuple[int, dict]:
+        """Decide the status of a request, injecting rate limits and errors.
+
+        Returns:
+            the status code and any headers to send with it.
+        """
+        with self._lock:
+            self.requests += 1
+            headers = {}
+            if self.rate_limit is not None:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.rate_limit,
+                    self._tokens + (now - self._refilled_at) * self.rate_limit,
+                )
+                self._refilled_at = now
+                if self._tokens < 1:
+                    self.throttled += 1
+                    if self.retry_after is not None:
+                        headers["Retry-After"] = str(self.retry_after)
+                    return 429, {**headers, "X-RateLimit-Remaining": "0"}
+                self._tokens -= 1
+                headers["X-RateLimit-Remaining"] = str(math.floor(self._tokens))
+            if self._rng.random() < self.error_rate:
+                self.errors += 1
+                return self._rng.choice([500, 502, 503]), headers
+            return 200, headers
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(stub.latency)
+                status, headers = stub._admit()
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                parts = url.path.strip("/").split("/")
+                if status != 200:
+                    body = {"errors": [{"status": str(status)}]}
+                elif parts == ["transactions"]:
+                    body = stub._page(url.path, params)
+                elif len(parts) == 3 and parts[::2] == ["accounts", "transactions"]:
+                    body = stub._page(url.path, params, account_id=parts[1])
+                elif parts == ["accounts"]:
+                    body = stub._list_page(url.path, params, stub.accounts)
+                elif parts == ["categories"]:
+                    body = {"data": stub.categories, "links": {"self": stub.url}}
+                elif parts == ["util", "ping"]:
+                    body = {"meta": {"id": str(uuid.uuid4()), "statusEmoji": "⚡️"}}
+                else:
+                    status, body = 404, {"errors": [{"status": "404"}]}
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def _list_page(self, path: str, params: dict, rows: list[dict]) -> dict:
+        """A page of an unfiltered collection, such as the accounts."""
+        size = int(params.get("page[size]", PAGE_SIZE))
+        offset = int(params.get("page[after]", 0))
+        next_link = None
+        if offset + size < len(rows):
+            query = urlencode({**params, "page[after]": offset + size})
+            next_link = f"{self.url}{path}?{query}"
+        return {
+            "data": rows[offset : offset + size],
+            "links": {"prev": None, "next": next_link},
+        }
+
+    def _page(self, path: str, params: dict, account_id: str | None = None) -> dict:
+        keys, rows = self._index.get((account_id, params.get("filter[status]")), ([], []))
+        start, end = 0, len(rows)
+        if "filter[until]" in params:
+            until = datetime.datetime.fromisoformat(params["filter[until]"])
+            start = bisect.bisect_right(keys, -until.timestamp())
+        if "filter[since]" in params:
+            since = datetime.datetime.fromisoformat(params["filter[since]"])
+            end = bisect.bisect_right(keys, -since.timestamp())
+        size = int(params.get("page[size]", PAGE_SIZE))
+        offset = start + int(params.get("page[after]", 0))
+        next_link = None
+        if offset + size < end:
+            query = urlencode({**params, "page[after]": offset - start + size})
+            next_link = f"{self.url}{path}?{query}"
+        return {
+            "data": rows[offset : min(offset + size, end)],
+            "links": {"prev": None, "next": next_link},
+        }
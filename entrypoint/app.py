@@ -1,22 +1,85 @@
+import atexit
+import datetime
 import os
+import weakref
+from functools import partial
 
 import streamlit as st
+from cache import CachedBudgetData
+from config import BudgetData
+from pages.actuals import actuals
+from pages.budget import budget
+from pages.settings import settings
+from sources.mockdata import BudgetDataMock
+from sources.snapshots import SNAPSHOTS_SUPPORTED, SnapshotStore
+from sources.upbank import BudgetDataUp, UpbankClient
+from sync import SyncTask, SyncWorker
+from timing import TimedBudgetData, Tracer
 
-from entrypoint.pages.actuals import actuals
-from entrypoint.pages.budget import budget
-from src_mockdata import BudgetDataMock
-from src_upbank import BudgetDataUp, UpbankClient
-
+# The database before snapshots, copied as the first generation of the store. Where
+# snapshots aren't supported the source keeps using this file, through one connection.
 DATABASE_CONNECTION = "./db/db.duckdb"
+SNAPSHOT_DIRECTORY = "./db/snapshots"
+# Settled transactions older than ARCHIVE_AFTER_DAYS are moved here as Parquet.
+ARCHIVE_DIRECTORY = "./db/archive"
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 90))
 UPBANK_TOKEN = os.getenv("UPBANK_TOKEN")
 IS_MOCK_DATA = os.getenv("IS_MOCK_DATA", False)
-REFRESH_DATA = os.getenv("REFRESH_DATA", False)  # THIS Needs to be a button somewhere.
+# Sync the transactions when the app starts, as well as on the schedule.
+REFRESH_DATA = os.getenv("REFRESH_DATA", False)
+# Minutes between background syncs of the transactions, or 0 not to schedule them.
+SYNC_INTERVAL_MINUTES = int(os.getenv("SYNC_INTERVAL_MINUTES", 60))
+# JSON lines file the timing spans of every rerun are appended to, if set.
+PERFORMANCE_LOG = os.getenv("PERFORMANCE_LOG")
+
+
+@st.cache_resource
+def get_budget_data() -> BudgetData:
+    """Create the data source once per process and share it with every session.
+
+    Streamlit reruns this script on every interaction, so the source, its api
+    client and its database connection are kept between reruns.
+    """
+    if IS_MOCK_DATA:
+        budget_data = BudgetDataMock()
+    else:
+        client = UpbankClient(UPBANK_TOKEN)
+        database = DATABASE_CONNECTION
+        if SNAPSHOTS_SUPPORTED:
+            database = SnapshotStore(SNAPSHOT_DIRECTORY, initial=DATABASE_CONNECTION)
+        budget_data = BudgetDataUp(
+            client,
+            database,
+            archive_directory=ARCHIVE_DIRECTORY,
+            archive_after_days=ARCHIVE_AFTER_DAYS,
+        )
+        atexit.register(client.close)
+    atexit.register(budget_data.close)
+    return budget_data
+
+
+@st.cache_resource
+def get_sync_worker() -> SyncWorker:
+    """Start the one worker that refreshes the shared data source in the background."""
+    interval = datetime.timedelta(minutes=SYNC_INTERVAL_MINUTES) if SYNC_INTERVAL_MINUTES else None
+    sync_worker = SyncWorker(get_budget_data(), interval).start()
+    if REFRESH_DATA:
+        sync_worker.enqueue(SyncTask.TRANSACTIONS)
+    atexit.register(sync_worker.close)
+    return sync_worker
+
+
+def get_session_budget_data() -> CachedBudgetData:
+    """Returns this session's cursor on the shared data source, with its cache."""
+    if "budget_data" not in st.session_state:
+        cursor = get_budget_data().cursor()
+        budget_data = CachedBudgetData(cursor)
+        # Streamlit drops the session state when the session ends, so close the
+        # cursor then, rather than keep its connection until the process exits.
+        weakref.finalize(budget_data, cursor.close)
+        st.session_state["budget_data"] = budget_data
+    return st.session_state["budget_data"]
 
-if IS_MOCK_DATA:
-    generator = BudgetDataMock()
-else:
-    client = UpbankClient(UPBANK_TOKEN)
-    generator = BudgetDataUp(client, DATABASE_CONNECTION)
 
 st.set_page_config(
     page_title="Budget Application",
@@ -25,9 +88,45 @@ st.set_page_config(
     initial_sidebar_state="auto",
 )
 
-pages = {"Actuals": actuals, "Budget": budget}
-page = st.sidebar.selectbox("PAGES", ["Actuals", "Budget"])
-pages[page](generator)
+
+def get_session_tracer() -> Tracer:
+    """Returns this session's tracer, which holds the spans of its last rerun."""
+    if "tracer" not in st.session_state:
+        st.session_state["tracer"] = Tracer(PERFORMANCE_LOG)
+    return st.session_state["tracer"]
+
+
+def performance_panel(tracer: Tracer) -> None:
+    """Show where the time of the rerun went in the sidebar."""
+    spans = tracer.to_frame()
+    with st.sidebar.expander("Performance", expanded=True):
+        st.caption(f"Rerun took {spans['ms'].iloc[0]:,.1f} ms")
+        st.dataframe(
+            spans,
+            hide_index=True,
+            column_config={"ms": st.column_config.NumberColumn(format="%.1f")},
+        )
+
+
+pages = {
+    "Actuals": actuals,
+    "Budget": budget,
+    "Settings": partial(settings, sync_worker=get_sync_worker()),
+}
+page = st.sidebar.selectbox("PAGES", list(pages))
+show_performance = st.sidebar.checkbox("Show performance")
+if show_performance or PERFORMANCE_LOG:
+    # Only time the rerun when asked to, so it costs nothing otherwise.
+    tracer = get_session_tracer().activate()
+    try:
+        with tracer.span(f"page.{page.lower()}"):
+            pages[page](TimedBudgetData(get_session_budget_data()))
+    finally:
+        tracer.finish()
+    if show_performance:
+        performance_panel(tracer)
+else:
+    pages[page](get_session_budget_data())
 
 
 # import streamlit as st
@@ -0,0 +1,63 @@
+"""Backfill the transaction history older than the app syncs.
+
+Load the settled transactions from Up in chunks, newest first, into the snapshot
+store and archive the app reads, committing each chunk, so the dashboard shows the
+history as it loads. An interrupted backfill resumes from the last chunk committed.
+
+Usage:
+    uv run python entrypoint/backfill.py
+    uv run python entrypoint/backfill.py --since 2020-01-01 --chunk-days 14
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import time
+
+from sources.snapshots import SnapshotStore
+from sources.upbank import BACKFILL_CHUNK_DAYS, BudgetDataUp, UpbankClient
+
+# The same database and archive as the app.
+DATABASE_CONNECTION = "./db/db.duckdb"
+SNAPSHOT_DIRECTORY = "./db/snapshots"
+ARCHIVE_DIRECTORY = "./db/archive"
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 90))
+UPBANK_TOKEN = os.getenv("UPBANK_TOKEN")
+
+
+def main(since: datetime.date | None, chunk_days: int) -> int:
+    with UpbankClient(UPBANK_TOKEN) as client:
+        budget_data = BudgetDataUp(
+            client,
+            SnapshotStore(SNAPSHOT_DIRECTORY, initial=DATABASE_CONNECTION),
+            archive_directory=ARCHIVE_DIRECTORY,
+            archive_after_days=ARCHIVE_AFTER_DAYS,
+        )
+        started = time.perf_counter()
+        total = 0
+        print(f"{'chunk':>23} {'transactions':>12} {'seconds':>8} {'per second':>10}")
+        try:
+            for chunk in budget_data.backfill(since, chunk_days):
+                total += chunk.transactions
+                print(f"{chunk.since:%Y-%m-%d} to {chunk.until:%Y-%m-%d} {chunk.transactions:>12,} {chunk.seconds:>8.1f} {chunk.transactions_per_second:>10,.0f}")
+        except KeyboardInterrupt:
+            print("Interrupted, run the backfill again to resume.")
+            return 130
+        finally:
+            budget_data.close()
+    print(f"Loaded {total:,} transactions in {time.perf_counter() - started:,.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--since",
+        type=datetime.date.fromisoformat,
+        default=None,
+        help="date to load from, by default when the oldest account was opened",
+    )
+    parser.add_argument("--chunk-days", type=int, default=BACKFILL_CHUNK_DAYS)
+    args = parser.parse_args()
+    sys.exit(main(args.since, args.chunk_days))
@@ -0,0 +1,275 @@
+"""Budget data cache.
+
+Memoize the results of a budget data source between Streamlit reruns.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+import pandas as pd
+from config import BudgetData, BudgetPeriod
+
+CACHE_MAX_ENTRIES = 128
+CACHE_MAX_BYTES = 256 * 1024**2
+
+
+@dataclass
+class CacheStats:
+    """Running totals of the lookups made against a `CachedBudgetData`."""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    entries: int = 0
+    bytes: int = 0
+
+
+class CachedBudgetData:
+    """Wrap a `BudgetData` source and memoize its results.
+
+    Results are kept in a least recently used cache keyed by the method and its
+    normalized filters, bounded by both the number of entries and their size in
+    memory. The cache is emptied when the source's `generation` changes, which
+    the refresh methods do. Cached frames are shared, so callers must not modify
+    them in place.
+    """
+
+    def __init__(
+        self,
+        budget_data: BudgetData,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_bytes: int = CACHE_MAX_BYTES,
+    ):
+        """
+        budget_data: BudgetData: the data source to cache.
+        max_entries: int: maximum number of results kept.
+        max_bytes: int: maximum estimated size of the results kept.
+        """
+        self.budget_data = budget_data
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stats = CacheStats()
+        self._entries: OrderedDict[tuple, tuple[Any, int]] = OrderedDict()
+        self._generation = budget_data.generation
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        # Anything that is not cached, such as the refresh methods.
+        return getattr(self.budget_data, name)
+
+    def get_transactions(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+        validate_transactions: bool = True,
+    ) -> pd.DataFrame:
+        key = (
+            "get_transactions",
+            start_date,
+            end_date,
+            account,
+            tuple(sorted(excluded_categories or [])),
+            tuple(sorted(excluded_subcategories or [])),
+            validate_transactions,
+        )
+        return self._cached(
+            key,
+            lambda: self.budget_data.get_transactions(
+                start_date,
+                end_date,
+                account,
+                excluded_categories,
+                excluded_subcategories,
+                validate_transactions,
+            ),
+        )
+
+    def get_largest_transactions(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+        limit: int = 10,
+    ) -> pd.DataFrame:
+        key = (
+            "get_largest_transactions",
+            start_date,
+            end_date,
+            account,
+            tuple(sorted(excluded_categories or [])),
+            tuple(sorted(excluded_subcategories or [])),
+            limit,
+        )
+        return self._cached(
+            key,
+            lambda: self.budget_data.get_largest_transactions(
+                start_date,
+                end_date,
+                account,
+                excluded_categories,
+                excluded_subcategories,
+                limit,
+            ),
+        )
+
+    def get_metrics(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+    ) -> dict:
+        key = (
+            "get_metrics",
+            start_date,
+            end_date,
+            account,
+            tuple(sorted(excluded_categories or [])),
+            tuple(sorted(excluded_subcategories or [])),
+        )
+        return self._cached(
+            key,
+            lambda: self.budget_data.get_metrics(
+                start_date,
+                end_date,
+                account,
+                excluded_categories,
+                excluded_subcategories,
+            ),
+        )
+
+    def get_rolling_trend(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+        window_days: int = 30,
+        types: list[str] = None,
+    ) -> pd.DataFrame:
+        key = (
+            "get_rolling_trend",
+            start_date,
+            end_date,
+            account,
+            tuple(sorted(excluded_categories or [])),
+            tuple(sorted(excluded_subcategories or [])),
+            window_days,
+            tuple(types or []),
+        )
+        return self._cached(
+            key,
+            lambda: self.budget_data.get_rolling_trend(
+                start_date,
+                end_date,
+                account,
+                excluded_categories,
+                excluded_subcategories,
+                window_days,
+                types,
+            ),
+        )
+
+    def get_period_spend(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+        period: BudgetPeriod = BudgetPeriod.MONTH,
+        group_by: str = "category",
+    ) -> dict:
+        key = (
+            "get_period_spend",
+            start_date,
+            end_date,
+            account,
+            tuple(sorted(excluded_categories or [])),
+            tuple(sorted(excluded_subcategories or [])),
+            BudgetPeriod(period),
+            group_by,
+        )
+        return self._cached(
+            key,
+            lambda: self.budget_data.get_period_spend(
+                start_date,
+                end_date,
+                account,
+                excluded_categories,
+                excluded_subcategories,
+                period,
+                group_by,
+            ),
+        )
+
+    def get_categories(self) -> list[str]:
+        return self._cached(("get_categories",), self.budget_data.get_categories)
+
+    def get_subcategories(self) -> list[str]:
+        return self._cached(("get_subcategories",), self.budget_data.get_subcategories)
+
+    def get_accounts(self) -> list[str]:
+        return self._cached(("get_accounts",), self.budget_data.get_accounts)
+
+    def get_account_balances(self) -> pd.DataFrame:
+        return self._cached(("get_account_balances",), self.budget_data.get_account_balances)
+
+    def clear(self) -> None:
+        """Empty the cache."""
+        with self._lock:
+            self._entries.clear()
+            self.stats.entries = self.stats.bytes = 0
+
+    def _cached(self, key: tuple, load) -> Any:
+        """Return the cached result for key, calling load on a miss."""
+        with self._lock:
+            if self.budget_data.generation != self._generation:
+                self._entries.clear()
+                self.stats.entries = self.stats.bytes = 0
+                self._generation = self.budget_data.generation
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return self._entries[key][0]
+            self.stats.misses += 1
+            generation = self._generation
+
+        value = load()
+        size = _size_of(value)
+        with self._lock:
+            # Don't keep results loaded while the data was being refreshed.
+            if generation != self.budget_data.generation or key in self._entries:
+                return value
+            self._entries[key] = (value, size)
+            self.stats.bytes += size
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.stats.bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.stats.bytes -= evicted_size
+                self.stats.evictions += 1
+            self.stats.entries = len(self._entries)
+        return value
+
+
+def _size_of(value: Any) -> int:
+    """Estimate the memory used by a cached result, in bytes."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size_of(v) for v in value.values())
+    if isinstance(value, list | tuple):
+        return sys.getsizeof(value) + sum(_size_of(v) for v in value)
+    return sys.getsizeof(value)
@@ -1,7 +1,11 @@
 import datetime as dt
+import math
 from typing import Any
 import streamlit as st
 
+# Cards shown on each page of a listing.
+LISTING_PAGE_SIZE = 50
+
 
 def get_filters(
     accounts: list[str], categories: list[str], subcategories: list[str]
@@ -31,3 +35,18 @@ def get_filters(
         "excluded_categories": excluded_categories,
         "excluded_subcategories": excluded_subcategories,
     }
+
+
+def paginate(items: list, key: str, page_size: int = LISTING_PAGE_SIZE) -> list:
+    """Returns the page of items picked in a page selector.
+
+    The selector is only shown when there is more than one page, so a listing
+    renders the same number of elements however long it is.
+    """
+    pages = math.ceil(len(items) / page_size)
+    if pages <= 1:
+        return items
+    page = st.number_input(
+        f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=key
+    )
+    return items[(page - 1) * page_size : page * page_size]
@@ -1,10 +1,19 @@
 import datetime
+from collections.abc import Callable
 from decimal import Decimal
 from enum import StrEnum
 from typing import Protocol
 
 import pandas as pd
 from pandantic import BaseModel
+from pandas.api import types
+
+# Transaction amounts are absolute values, in dollars.
+AMOUNT_RANGE = (0, 10_000_000)
+# Rows checked per call when transactions are validated by sampling.
+VALIDATION_SAMPLE_SIZE = 1_000
+# The financial year starts on the first of July.
+FINANCIAL_YEAR_START_MONTH = 7
 
 
 class TransactionTypes(StrEnum):
@@ -12,12 +21,43 @@ class TransactionTypes(StrEnum):
     PURCHASE = "Purchase"
 
 
+class BudgetPeriod(StrEnum):
+    """The periods spending is budgeted over."""
+
+    WEEK = "week"
+    MONTH = "month"
+    QUARTER = "quarter"
+    YEAR = "year"
+    FINANCIAL_YEAR = "financial_year"
+
+    def truncation(self) -> tuple[str, int]:
+        """The `date_trunc` part for the period, and the months it is shifted by.
+
+        A financial year is a calendar year shifted to start in
+        `FINANCIAL_YEAR_START_MONTH`.
+        """
+        if self == BudgetPeriod.FINANCIAL_YEAR:
+            return BudgetPeriod.YEAR.value, FINANCIAL_YEAR_START_MONTH - 1
+        return self.value, 0
+
+
+class ValidationMode(StrEnum):
+    """When a data source validates the transactions it returns."""
+
+    # Validate every transaction returned.
+    FULL = "full"
+    # Validate a random sample of the transactions returned.
+    SAMPLE = "sample"
+    # Validate transactions once when they are loaded and trust them afterwards.
+    INGEST = "ingest"
+    OFF = "off"
+
+
 class TransactionSchema(BaseModel):
     """The expected schema of a transaction."""
 
     id: str
-    created_date: str
-    type: str
+    created_date: datetime.datetime
     description: str
     type: TransactionTypes
     category: str
@@ -26,8 +66,60 @@ class TransactionSchema(BaseModel):
     account: str
     status: str
 
+    @classmethod
+    def validate_df(
+        cls,
+        df: pd.DataFrame,
+        errors: str = "raise",
+        sample_size: int | None = None,
+    ) -> pd.DataFrame:
+        """Validate a frame of transactions with vectorized checks.
+
+        Checks the column dtypes, that no field is null, that the types are
+        `TransactionTypes` and that the amounts are within `AMOUNT_RANGE`.
+
+        Args:
+            df: transactions to validate.
+            errors: "raise" to raise on invalid rows or "filter" to drop them.
+            sample_size: only check a random sample of this many rows.
+
+        Returns:
+            the transactions, less any invalid rows when filtering.
+
+        Raises:
+            TypeError: a column has the wrong dtype.
+            ValueError: a column is missing, or a row is invalid and errors="raise".
+        """
+        missing = set(cls.model_fields) - set(df.columns)
+        if missing:
+            raise ValueError(f"Missing transaction columns: {sorted(missing)}")
+        dtype_checks = {
+            datetime.datetime: types.is_datetime64_any_dtype,
+            Decimal: types.is_numeric_dtype,
+        }
+        for name, field in cls.model_fields.items():
+            is_valid_dtype = dtype_checks.get(field.annotation, types.is_string_dtype)
+            if not is_valid_dtype(df[name].dtype):
+                raise TypeError(f"Transaction column {name} has dtype {df[name].dtype}")
+
+        sample = df
+        if sample_size is not None and len(df) > sample_size:
+            sample = df.sample(n=sample_size)
+        invalid = sample[list(cls.model_fields)].isna().any(axis=1).to_numpy()
+        invalid |= ~sample["type"].isin(list(TransactionTypes)).to_numpy()
+        invalid |= ~sample["amount"].between(*AMOUNT_RANGE).to_numpy(dtype=bool, na_value=False)
+        if not invalid.any():
+            return df
+        if errors == "raise":
+            examples = sample.loc[invalid, "id"].head().tolist()
+            raise ValueError(f"{invalid.sum()} invalid transactions, e.g. {examples}")
+        return df.drop(index=sample.index[invalid])
+
 
 class BudgetData(Protocol):
+    # Incremented whenever the refresh methods change the data.
+    generation: int
+
     def get_transactions(
         self,
         start_date: datetime,
@@ -37,7 +129,77 @@ class BudgetData(Protocol):
         excluded_subcategories: list[str] = None,
         validate_transactions: bool = True,
     ) -> pd.DataFrame:
-        """Returns transaction data for the budget app"""
+        """Returns transaction data for the budget app.
+
+        The columns are Arrow backed (`pd.ArrowDtype`) and `created_date` is a
+        timezone aware timestamp.
+        """
+        ...
+
+    def get_largest_transactions(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+        limit: int = 10,
+    ) -> pd.DataFrame:
+        """Returns the `limit` largest filtered transactions that aren't income.
+
+        The same columns as `get_transactions`, sorted by amount, largest first.
+        """
+        ...
+
+    def get_metrics(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+    ) -> dict:
+        """Returns the budget metrics for the filtered transactions.
+
+        The total income and spending, and the income and spending by category and
+        subcategory, as computed by `metrics.calculate_budget_metrics`.
+        """
+        ...
+
+    def get_rolling_trend(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+        window_days: int = 30,
+        types: list[str] = None,
+    ) -> pd.DataFrame:
+        """Returns the rolling sum of the filtered transactions by day and type.
+
+        A `day`, `type` and `amount` for every day of the period, as computed by
+        `metrics.calculate_rolling_trend`.
+        """
+        ...
+
+    def get_period_spend(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+        period: BudgetPeriod = BudgetPeriod.MONTH,
+        group_by: str = "category",
+    ) -> dict:
+        """Returns the filtered transactions summed by period and group.
+
+        The `spend` matrix of amounts with a row per period and a column per
+        category or subcategory, and the `mean` amount of each group over the
+        periods it has transactions in, as computed by
+        `metrics.calculate_period_spend`.
+        """
         ...
 
     def get_categories(self) -> list[str]:
@@ -56,14 +218,27 @@ class BudgetData(Protocol):
         """Returns a list of accounts and their balances"""
         ...
 
-    def refresh_transactions(self) -> None:
-        """Refresh transactions data"""
+    def cursor(self) -> "BudgetData":
+        """Returns a handle on the data source for one session or thread"""
+        ...
+
+    def close(self) -> None:
+        """Release the data source's connections"""
+        ...
+
+    def refresh_transactions(self, full_refresh: bool = False, progress: Callable[[int], None] = None) -> int:
+        """Refresh transactions data and increment the generation.
+
+        The new data is swapped in at once when the refresh finishes. Returns the
+        number of transactions loaded, calling `progress` with the number loaded
+        so far as they are.
+        """
         ...
 
     def refresh_accounts(self) -> None:
-        """Refresh accounts data"""
+        """Refresh accounts data and increment the generation"""
         ...
 
     def _validate_transactions(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Validate transactions"""
+        """Validate transactions according to the source's `ValidationMode`"""
         ...
@@ -0,0 +1,118 @@
+"""Downsampling.
+
+Reduce the points of a line to a fixed number before it is charted, keeping its
+visual shape, so the figure sent to the browser stays the same size however long
+a history the line covers.
+"""
+
+from enum import StrEnum
+
+import numpy as np
+import pandas as pd
+
+
+class DownsampleMethod(StrEnum):
+    # Largest triangle three buckets, keeping the points that best preserve the
+    # shape of the line.
+    LTTB = "lttb"
+    # The lowest and highest point of each bucket, keeping every peak.
+    MIN_MAX = "min_max"
+
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """Pick the points of a line by largest triangle three buckets.
+
+    The first and last points are kept, and the points between are split into
+    equal buckets. From each bucket the point forming the largest triangle with
+    the point picked from the previous bucket and the mean of the next is kept.
+
+    Args:
+        x (np.ndarray): The numeric or datetime x values of the line, in
+            ascending order.
+        y (np.ndarray): The y values of the line.
+        points (int): The number of points to pick, at least 3.
+
+    Returns:
+        np.ndarray: The sorted indices of the points picked.
+    """
+    n = len(x)
+    if n <= points:
+        return np.arange(n)
+    x = x.astype(float)
+    y = y.astype(float)
+    # The bucket bounds, with the last point as a bucket of its own.
+    edges = np.append(np.linspace(1, n - 1, points - 1).astype(int), n)
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x, edges[:-1]) / sizes
+    mean_y = np.add.reduceat(y, edges[:-1]) / sizes
+    # Each pick depends on the last, and the buckets only hold a few points, so
+    # they are scanned with plain python floats rather than numpy calls.
+    x, y, edges = x.tolist(), y.tolist(), edges.tolist()
+    mean_x, mean_y = mean_x.tolist(), mean_y.tolist()
+    picked = [0]
+    a = 0
+    for bucket in range(points - 2):
+        ax, ay = x[a], y[a]
+        dx, dy = ax - mean_x[bucket + 1], mean_y[bucket + 1] - ay
+        largest = -1.0
+        for i in range(edges[bucket], edges[bucket + 1]):
+            area = abs(dx * (y[i] - ay) - (ax - x[i]) * dy)
+            if area > largest:
+                largest, a = area, i
+        picked.append(a)
+    picked.append(n - 1)
+    return np.array(picked)
+
+
+def min_max(y: np.ndarray, points: int) -> np.ndarray:
+    """Pick the lowest and highest point of each of `points // 2` equal buckets.
+
+    Args:
+        y (np.ndarray): The y values of the line.
+        points (int): The number of points to pick.
+
+    Returns:
+        np.ndarray: The sorted indices of the points picked.
+    """
+    n = len(y)
+    if n <= points:
+        return np.arange(n)
+    buckets = np.arange(n) * max(points // 2, 1) // n
+    # Sorted by bucket then value, each bucket starts at its lowest point and
+    # ends at its highest.
+    order = np.lexsort((y, buckets))
+    starts = np.flatnonzero(np.diff(buckets[order], prepend=-1))
+    ends = np.append(starts[1:], n) - 1
+    return np.unique(np.concatenate([order[starts], order[ends]]))
+
+
+def downsample(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    groupby: str,
+    points: int,
+    method: DownsampleMethod = DownsampleMethod.LTTB,
+) -> pd.DataFrame:
+    """Downsample each group's line to at most `points` points.
+
+    Points without a y value aren't charted, so they are dropped first.
+
+    Args:
+        df (pd.DataFrame): The lines, sorted by `x` within each group.
+        x (str): The column of x values.
+        y (str): The column of y values.
+        groupby (str): The column identifying each line.
+        points (int): The maximum number of points kept of each line.
+        method (DownsampleMethod): How the points are picked.
+
+    Returns:
+        pd.DataFrame: The rows of `df` picked from each line.
+    """
+    df = df[df[y].notna()]
+    groups = []
+    for _, line in df.groupby(groupby, observed=True, sort=False):
+        values = line[y].to_numpy(dtype=float)
+        picked = min_max(values, points) if method == DownsampleMethod.MIN_MAX else lttb(line[x].to_numpy(), values, points)
+        groups.append(line.iloc[picked])
+    return pd.concat(groups) if groups else df
@@ -0,0 +1,193 @@
+"""Budget metrics.
+
+Aggregate transactions into the totals and breakdowns shown on the actuals page.
+"""
+
+import datetime
+
+import numpy as np
+import pandas as pd
+from config import BudgetPeriod, TransactionTypes
+
+# The `level` of each row of a metrics rollup, as returned by duckdb's
+# `grouping(category, subcategory)` for the grouping set it belongs to.
+TOTAL_LEVEL = 3
+CATEGORY_LEVEL = 1
+SUBCATEGORY_LEVEL = 2
+CATEGORY_SUBCATEGORY_LEVEL = 0
+
+
+def calculate_budget_metrics(df: pd.DataFrame) -> dict:
+    """Calculate key budget metrics from transaction data.
+
+    The fallback for sources that can't aggregate in a query. Transactions are
+    summed once by type, category and subcategory, and the coarser levels of the
+    rollup are summed from that much smaller frame.
+
+    Args:
+        df (pd.DataFrame): Transactions as returned by `get_transactions`.
+
+    Returns:
+        dict: The budget metrics, see `metrics_from_rollup`.
+    """
+    df = df[df["type"].isin(list(TransactionTypes))]
+    detail = df.groupby(["type", "category", "subcategory"], observed=True)["amount"].sum().reset_index()
+    rollup = pd.concat(
+        [
+            detail.groupby("type")["amount"].sum().reset_index().assign(level=TOTAL_LEVEL),
+            detail.groupby(["type", "category"])["amount"].sum().reset_index().assign(level=CATEGORY_LEVEL),
+            detail.groupby(["type", "subcategory"])["amount"].sum().reset_index().assign(level=SUBCATEGORY_LEVEL),
+            detail.assign(level=CATEGORY_SUBCATEGORY_LEVEL),
+        ]
+    )
+    return metrics_from_rollup(rollup)
+
+
+def metrics_from_rollup(rollup: pd.DataFrame) -> dict:
+    """Shape a rollup of transaction amounts into the budget metrics.
+
+    Args:
+        rollup (pd.DataFrame): Summed `amount` by `type`, with `category` and
+            `subcategory` set according to each row's `level`.
+
+    Returns:
+        dict: The total income and spending, and the income and spending by
+            category and subcategory sorted largest first.
+    """
+    # The rollup only has a row per category, so shape it with numpy rather than
+    # paying pandas' per operation overhead on its Arrow backed columns.
+    transaction_types = rollup["type"].to_numpy(dtype=object)
+    levels = rollup["level"].to_numpy(dtype=int)
+    amounts = rollup["amount"].to_numpy(dtype=float)
+    category = rollup["category"].to_numpy(dtype=object).astype(str)
+    subcategory = rollup["subcategory"].to_numpy(dtype=object).astype(str)
+
+    def breakdown(transaction_type: str, level: int, label) -> pd.Series:
+        mask = (transaction_types == transaction_type) & (levels == level)
+        return pd.Series(amounts[mask], index=pd.Index(label[mask], dtype=object), name="amount").sort_values(ascending=False)
+
+    def total(transaction_type: str) -> float:
+        mask = (transaction_types == transaction_type) & (levels == TOTAL_LEVEL)
+        return float(amounts[mask].sum())
+
+    return {
+        "total_income": total(TransactionTypes.INCOME),
+        "total_spending": total(TransactionTypes.PURCHASE),
+        "spending_by_category": breakdown(TransactionTypes.PURCHASE, CATEGORY_LEVEL, category),
+        "spending_by_subcategory": breakdown(
+            TransactionTypes.PURCHASE,
+            CATEGORY_SUBCATEGORY_LEVEL,
+            np.char.add(np.char.add(category, ": "), subcategory),
+        ),
+        "income_by_category": breakdown(TransactionTypes.INCOME, CATEGORY_LEVEL, category),
+        "income_by_subcategory": breakdown(TransactionTypes.INCOME, SUBCATEGORY_LEVEL, subcategory),
+    }
+
+
+def calculate_rolling_trend(
+    df: pd.DataFrame,
+    start_date: datetime.date,
+    end_date: datetime.date,
+    window_days: int,
+    types: list[str] = None,
+) -> pd.DataFrame:
+    """Calculate the rolling sum of transaction amounts for each day and type.
+
+    The fallback for sources that can't aggregate in a query. The daily sums are
+    pivoted to a column per type, so every type is gap filled and rolled at once.
+
+    Args:
+        df (pd.DataFrame): Transactions as returned by `get_transactions`.
+        start_date (datetime.date): The first day of the trend.
+        end_date (datetime.date): The last day of the trend.
+        window_days (int): The number of days summed for each day of the trend.
+        types (list[str], optional): The transaction types to include.
+            Defaults to all the `TransactionTypes`.
+
+    Returns:
+        pd.DataFrame: The `day`, `type` and rolling `amount`, with an amount for
+            every day of the period and no amount until a full window has passed.
+    """
+    types = list(types or TransactionTypes)
+    days = pd.date_range(start_date, end_date, freq="D", name="day")
+    daily = (
+        df[df["type"].isin(types)]
+        .groupby([df["created_date"].dt.date.rename("day"), "type"], observed=True)["amount"]
+        .sum()
+        .astype(float)
+        .unstack("type")
+        .reindex(index=days.date, columns=types)
+        .fillna(0.0)
+    )
+    rolling = daily.rolling(window_days).sum().set_axis(days)
+    rolling.columns.name = "type"
+    return rolling.melt(ignore_index=False, value_name="amount").reset_index()
+
+
+def calculate_period_spend(
+    df: pd.DataFrame,
+    period: BudgetPeriod = BudgetPeriod.MONTH,
+    group_by: str = "category",
+) -> dict:
+    """Calculate the amount of each period and group, and each group's mean.
+
+    The fallback for sources that can't aggregate in a query. Periods are
+    truncated with numpy datetime arithmetic rather than pandas Periods.
+
+    Args:
+        df (pd.DataFrame): Transactions as returned by `get_transactions`.
+        period (BudgetPeriod): The period the amounts are summed over.
+        group_by (str): The column the amounts are grouped by, either `category`
+            or `subcategory`.
+
+    Returns:
+        dict: The period spend, see `period_spend_from_totals`.
+    """
+    days = df["created_date"].dt.tz_localize(None).to_numpy(dtype="datetime64[D]")
+    totals = (
+        pd.DataFrame(
+            {
+                "period": _truncate(days, BudgetPeriod(period)),
+                "spend_group": df[group_by].to_numpy(dtype=object),
+                "amount": df["amount"].to_numpy(dtype=float),
+            }
+        )
+        .groupby(["period", "spend_group"])["amount"]
+        .sum()
+        .reset_index()
+    )
+    totals["mean_amount"] = totals.groupby("spend_group")["amount"].transform("mean")
+    return period_spend_from_totals(totals, group_by)
+
+
+def period_spend_from_totals(totals: pd.DataFrame, group_by: str) -> dict:
+    """Shape the amounts summed by period and group into the period spend.
+
+    Args:
+        totals (pd.DataFrame): The `amount` of each `period` and `spend_group`,
+            and the `mean_amount` of the group over its periods.
+        group_by (str): The name of the grouping column.
+
+    Returns:
+        dict: The `spend` matrix with a row per period and a column per group,
+            and the `mean` of each group sorted largest first.
+    """
+    spend = totals.pivot(index="period", columns="spend_group", values="amount")
+    spend.index = pd.DatetimeIndex(spend.index, name="period")
+    spend.columns.name = group_by
+    mean = totals.drop_duplicates("spend_group").set_index("spend_group")["mean_amount"].rename_axis(group_by).rename("amount").sort_values(ascending=False)
+    return {"spend": spend, "mean": mean}
+
+
+def _truncate(days: np.ndarray, period: BudgetPeriod) -> np.ndarray:
+    """Truncate an array of `datetime64[D]` days to the start of their period."""
+    part, shift_months = period.truncation()
+    if part == BudgetPeriod.WEEK:
+        # Weeks start on Monday, and the epoch was a Thursday.
+        return days - (days.astype(int) + 3) % 7
+    months = days.astype("datetime64[M]") - shift_months
+    if part == BudgetPeriod.QUARTER:
+        months -= months.astype(int) % 3
+    elif part == BudgetPeriod.YEAR:
+        months = months.astype("datetime64[Y]").astype("datetime64[M]")
+    return (months + shift_months).astype("datetime64[D]")
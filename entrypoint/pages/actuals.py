@@ -1,3 +1,4 @@
+import html
 from datetime import datetime, timedelta
 from typing import Any
 
@@ -5,58 +6,25 @@ import pandas as pd
 import plotly.express as px
 import streamlit as st
 
-from common import get_filters
-from config import BudgetData, TransactionTypes
+import timing
+from common import get_filters, paginate
+from config import BudgetData
+from downsample import DownsampleMethod, downsample
 from sources.mockdata import BudgetDataMock
 
+# The width in pixels the trend chart is drawn at on a typical screen, and so the
+# most points of each line worth sending to the browser.
+TREND_CHART_WIDTH = 1000
+# Lines are drawn with WebGL rather than SVG above this many points in total.
+WEBGL_POINT_THRESHOLD = 1000
 
-def calculate_budget_metrics(df: pd.DataFrame) -> dict:
-    """Calculate key budget metrics from transaction data"""
-    total_income = df[df["type"] == TransactionTypes.INCOME]["amount"].sum()
-    total_spending = df[df["type"] == TransactionTypes.PURCHASE]["amount"].sum()
-    spending_by_category = (
-        df[df["type"] == TransactionTypes.PURCHASE]
-        .groupby("category")["amount"]
-        .sum()
-        .sort_values(ascending=False)
-    )
-    spending_by_subcategory = (
-        df[df["type"] == TransactionTypes.PURCHASE]
-        .groupby(["category", "subcategory"])["amount"]
-        .sum()
-        .sort_values(ascending=False)
-    )
-    spending_by_subcategory.index = spending_by_subcategory.index.map(
-        "{0[0]}: {0[1]}".format
-    )
-    income_by_category = (
-        df[df["type"] == TransactionTypes.INCOME]
-        .groupby("category")["amount"]
-        .sum()
-        .sort_values(ascending=False)
-    )
-    income_by_subcategory = (
-        df[df["type"] == TransactionTypes.INCOME]
-        .groupby("subcategory")["amount"]
-        .sum()
-        .sort_values(ascending=False)
-    )
-    return {
-        "total_income": total_income,
-        "total_spending": total_spending,
-        "spending_by_category": spending_by_category,
-        "spending_by_subcategory": spending_by_subcategory,
-        "income_by_category": income_by_category,
-        "income_by_subcategory": income_by_subcategory,
-    }
 
-
-def create_category_card(category: str, spent: float, percent_of_total: float) -> None:
+def create_category_card(category: str, spent: float, percent_of_total: float) -> str:
     color = "#ff4b4b"
     return f"""
     <div style="padding: 1rem; border-radius: 8px; margin-bottom: 1rem; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
         <div style="display: flex; justify-content: space-between; margin-bottom: 0.5rem;">
-            <span style="font-weight: 600;">{category}</span>
+            <span style="font-weight: 600;">{html.escape(category)}</span>
             <span>${spent:,.2f} / {percent_of_total:,.2f}%</span>
         </div>
         <div style="background-color: #e0e0e0; border-radius: 4px; height: 8px;">
@@ -66,6 +34,7 @@ def create_category_card(category: str, spent: float, percent_of_total: float) -
     """
 
 
+@timing.timed("actuals.hero_metrics")
 def hero_metrics(total_income: float, total_spending: float) -> None:
     """Display the hero metrics
 
@@ -82,123 +51,150 @@ def hero_metrics(total_income: float, total_spending: float) -> None:
     # TODO: Break spending into discretionary and non discretionary
 
 
-def trend_line_chart(df: pd.DataFrame, x: str, y: str, groupby: str) -> None:
+@timing.timed("actuals.trend_line_chart")
+def trend_line_chart(
+    df: pd.DataFrame,
+    x: str,
+    y: str,
+    groupby: str,
+    method: DownsampleMethod = DownsampleMethod.LTTB,
+) -> None:
     st.subheader("📈 Trend")
-    fig = px.line(df, x=x, y=y, color=groupby, title=None)
+    # Keep a point per pixel of each line, and draw with WebGL once there are
+    # too many points for SVG to draw quickly.
+    with timing.span("actuals.downsample_trend", rows_in=len(df)) as span:
+        x_range = [df[x].min(), df[x].max()]
+        df = downsample(df, x, y, groupby, TREND_CHART_WIDTH, method)
+        span.rows_out = len(df)
+    render_mode = "webgl" if len(df) > WEBGL_POINT_THRESHOLD else "svg"
+    fig = px.line(df, x=x, y=y, color=groupby, title=None, render_mode=render_mode)
     fig.update_layout(
         margin=dict(l=20, r=20, t=20, b=20),
-        xaxis=dict(showgrid=True, gridcolor="#f0f0f0"),
+        xaxis=dict(showgrid=True, gridcolor="#f0f0f0", range=x_range),
         yaxis=dict(showgrid=True, gridcolor="#f0f0f0"),
     )
     st.plotly_chart(fig, use_container_width=True)
 
 
+def create_transaction_card(
+    description: str,
+    amount: float,
+    created_date: datetime,
+    category: str,
+    account: str,
+) -> str:
+    return f"""
+    <div style="padding: 1rem; border-radius: 8px; margin-bottom: 0.5rem; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
+        <div style="display: flex; justify-content: space-between;">
+            <span>{html.escape(description)}</span>
+            <span style="color: #ff4b4b;">${amount:,.2f}</span>
+        </div>
+        <div style="color: #666; font-size: 0.9rem;">
+            {created_date.strftime('%B %d, %Y')} • {html.escape(category)} • {html.escape(account)}
+        </div>
+    </div>
+    """
+
+
+def create_account_card(name: str, balance: float, details: str = None) -> str:
+    details = (
+        f'<div style="color: #666; font-size: 0.9rem;">{details}</div>'
+        if details
+        else ""
+    )
+    return f"""
+    <div style="padding: 1rem; border-radius: 8px; margin-bottom: 0.5rem; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
+        <div style="display: flex; justify-content: space-between;">
+            <span>{html.escape(name)}</span>
+            <span style="color: #2ca314">{balance}</span>
+        </div>{details}
+    </div>
+    """
+
+
+def render_cards(cards: list[str]) -> None:
+    """Render cards as a single markdown element.
+
+    Each element is sent to the browser separately, so a listing costs the same
+    to render however many cards it has. The cards are joined without blank
+    lines, which would end the markdown HTML block.
+    """
+    st.markdown("\n".join(card.strip() for card in cards), unsafe_allow_html=True)
+
+
+@timing.timed("actuals.transaction_listing")
 def transaction_listing(df: pd.DataFrame) -> None:
     st.subheader("📝 Largest Transactions")
-    for _, tx in df.iterrows():
-        st.markdown(
-            f"""
-            <div style="padding: 1rem; border-radius: 8px; margin-bottom: 0.5rem; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
-                <div style="display: flex; justify-content: space-between;">
-                    <span>{tx['description']}</span>
-                    <span style="color: #ff4b4b;">${tx['amount']:,.2f}</span>
-                </div>
-                <div style="color: #666; font-size: 0.9rem;">
-                    {tx['date'].strftime('%B %d, %Y')} • {tx['category']} • {tx['account']}
-                </div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
+    render_cards(
+        [
+            create_transaction_card(*tx)
+            for tx in zip(
+                df["description"],
+                df["amount"],
+                df["created_date"],
+                df["category"],
+                df["account"],
+                strict=True,
+            )
+        ]
+    )
 
 
+@timing.timed("actuals.account_listing")
 def account_listing(df: pd.DataFrame) -> None:
     st.subheader("📝 Account Balances")
-    st.markdown(
-        f"""
-            <div style="padding: 1rem; border-radius: 8px; margin-bottom: 0.5rem; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
-                <div style="display: flex; justify-content: space-between;">
-                    <span>Total Savings</span>
-                    <span style="color: #2ca314">${df['balance'].sum():,.2f}</span>
-                </div>
-            </div>
-            """,
-        unsafe_allow_html=True,
+    accounts = paginate(
+        list(
+            zip(
+                df["account_name"],
+                df["balance"],
+                df["account_type"],
+                df["ownership_type"],
+                strict=True,
+            )
+        ),
+        key="account_listing_page",
+    )
+    render_cards(
+        [create_account_card("Total Savings", f"${df['balance'].sum():,.2f}")]
+        + [
+            create_account_card(
+                name, f"${balance}", f"{account_type} • {ownership_type}"
+            )
+            for name, balance, account_type, ownership_type in accounts
+        ]
     )
-    for _, acc in df.iterrows():
-        st.markdown(
-            f"""
-            <div style="padding: 1rem; border-radius: 8px; margin-bottom: 0.5rem; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
-                <div style="display: flex; justify-content: space-between;">
-                    <span>{acc['account_name']}</span>
-                    <span style="color: #2ca314">${acc['balance']}</span>
-                </div>
-                <div style="color: #666; font-size: 0.9rem;">
-                    {acc['account_type']} • {acc['ownership_type']}
-                </div>
-            </div>
-            """,
-            unsafe_allow_html=True,
-        )
 
 
+@timing.timed("actuals.category_breakdown", rows_arg=1)
 def category_breakdown(
     heading: str, spending_categories: dict[str, float], total_spending: float
 ) -> None:
     st.markdown(f"### {heading}")
-    for category, spending in spending_categories.items():
-        percent_of_total = (spending / total_spending) * 100
-        st.markdown(
-            create_category_card(category, spending, percent_of_total),
-            unsafe_allow_html=True,
-        )
-
+    categories = paginate(
+        list(spending_categories.items()), key=f"category_breakdown_{heading}"
+    )
+    render_cards(
+        [
+            create_category_card(category, spending, (spending / total_spending) * 100)
+            for category, spending in categories
+        ]
+    )
 
-def actuals_profit_loss(df: pd.DataFrame) -> None:
-    # date to datetime
-    # TODO: move to the budget_data class
-    df["date"] = pd.to_datetime(df["created_date"], utc=True)
 
-    # Calculate metrics
-    metrics = calculate_budget_metrics(df)
+def actuals_profit_loss(budget_data: BudgetData, filters: dict[str, Any]) -> None:
+    metrics = budget_data.get_metrics(**filters)
     hero_metrics(metrics["total_income"], metrics["total_spending"])
 
     # Create two columns for the main content
     left_col, right_col = st.columns([2, 1])
     with left_col:
         # Chart trend
-        trend_df = df.copy()
-        trend_df["day"] = pd.to_datetime(trend_df["date"], utc=True).dt.date
-        trend_df = (
-            trend_df.groupby(["day", "type"]).agg({"amount": "sum"}).reset_index()
-        )
-        trend_dfs = []
         rolling_days = st.number_input("Trend Rolling Days", value=30)
-        for transaction_type in TransactionTypes:
-            # Add missing days
-            _trend_df = (
-                trend_df[trend_df["type"] == transaction_type][["day", "amount"]]
-                .set_index("day")
-                .asfreq("D")
-            )
-            # Calculate rolling sum
-            _trend_df = (
-                _trend_df.groupby(["day"])["amount"]
-                .sum()
-                .rolling(rolling_days)
-                .sum()
-                .reset_index()
-            )
-            _trend_df["type"] = transaction_type
-            trend_dfs.append(_trend_df)
-
-        trend_line_chart(pd.concat(trend_dfs), "day", "amount", "type")
+        trend_df = budget_data.get_rolling_trend(**filters, window_days=rolling_days)
+        trend_line_chart(trend_df, "day", "amount", "type")
         # Transaction list
-        transaction_listing(
-            df[df["type"] != TransactionTypes.INCOME]
-            .sort_values("amount", ascending=False)
-            .head(10)
-        )
+        transaction_listing(budget_data.get_largest_transactions(**filters, limit=10))
     with right_col:
         # Display category cards
         transaction_group = st.selectbox(
@@ -239,8 +235,7 @@ def actuals(budget_data: BudgetData) -> None:
         budget_data.get_categories(),
         budget_data.get_subcategories(),
     )
-    # Get transaction data
-    actuals_profit_loss(budget_data.get_transactions(**filters))
+    actuals_profit_loss(budget_data, filters)
     actuals_balance_sheet(budget_data.get_account_balances())
 
 
@@ -1,41 +1,12 @@
-from datetime import datetime, timedelta
-from typing import Any
-
-import pandas as pd
-import plotly.express as px
 import streamlit as st
 
+import timing
 from common import get_filters
-from config import BudgetData, TransactionTypes
-from src_mockdata import BudgetDataMock
-
-
-def get_mean_spending_by_category(
-    df: pd.DataFrame,
-    date_part: str = "M",
-    transaction_ts_name: str = "created_date",
-    category_name: str = "category",
-    transaction_amount_name: str = "amount",
-) -> dict[str:float]:
-    _df = df.copy()
-    _df["date_part"] = pd.to_datetime(_df[transaction_ts_name], utc=True).dt.to_period(
-        date_part
-    )
-    # Sum expenses by date part
-    _df = (
-        _df[["date_part", category_name, transaction_amount_name]]
-        .groupby(["date_part", category_name])
-        .agg({transaction_amount_name: "sum"})
-    ).reset_index()
-    # Average expenses over all date parts
-    _df = (
-        _df[[category_name, transaction_amount_name]]
-        .groupby([category_name])
-        .agg({transaction_amount_name: "mean"})
-    )
-    return _df.to_dict()["amount"]
+from config import BudgetData, BudgetPeriod
+from sources.mockdata import BudgetDataMock
 
 
+@timing.timed("budget.budget_vs_actual")
 def budget_vs_actual(category_spending: dict[str:float]) -> dict[str:float]:
     # Budget vs Actual
     st.subheader("📊 Category Budgets")
@@ -70,18 +41,19 @@ def budget(budget_data: BudgetData) -> None:
         budget_data.get_subcategories(),
     )
     left_col, right_col = st.columns([2, 1])
-    budget_date_part = left_col.selectbox("Pick budget period", ["Month", "Week"])
+    budget_period = left_col.selectbox(
+        "Pick budget period",
+        list(BudgetPeriod),
+        index=list(BudgetPeriod).index(BudgetPeriod.MONTH),
+        format_func=lambda period: period.replace("_", " ").title(),
+    )
     transaction_group = right_col.selectbox(
         "Pick transaction grouping", ["category", "subcategory"]
     )
-    date_part_map = {"Month": "M", "Week": "W"}
-    set_budget = budget_vs_actual(
-        get_mean_spending_by_category(
-            df=budget_data.get_transactions(**filters),
-            date_part=date_part_map[budget_date_part],
-            category_name=transaction_group,
-        )
+    period_spend = budget_data.get_period_spend(
+        **filters, period=budget_period, group_by=transaction_group
     )
+    set_budget = budget_vs_actual(period_spend["mean"].to_dict())
     st.write(set_budget)
 
 
@@ -1,30 +1,69 @@
 import streamlit as st
 
+from config import BudgetData
 from sources.mockdata import BudgetDataMock
+from sync import SyncState, SyncTask, SyncWorker
 
 
-if __name__ == "__main__":
-    # Generate sample transactions
-    budget_data = BudgetDataMock()
+@st.fragment(run_every="2s")
+def sync_status(sync_worker: SyncWorker) -> None:
+    """Show the sync worker's progress, refreshed while the page is open."""
+    status = sync_worker.status
+    if status.state == SyncState.RUNNING:
+        st.info(f"Syncing {status.task.replace('_', ' ')}: {status.rows_loaded:,} transactions loaded")
+    elif status.state == SyncState.FAILED:
+        st.error(f"Last sync failed: {status.last_error}")
+    if status.queued:
+        st.caption("Queued: " + ", ".join(t.replace("_", " ") for t in status.queued))
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric(
+        "Last sync",
+        status.last_sync_at.strftime("%d %b %H:%M:%S") if status.last_sync_at else "-",
+    )
+    col2.metric(
+        "Rows ingested",
+        f"{status.last_rows:,}" if status.last_rows is not None else "-",
+    )
+    col3.metric(
+        "Duration",
+        f"{status.last_seconds:,.1f}s" if status.last_seconds is not None else "-",
+    )
+    if status.next_scheduled_at:
+        st.caption(f"Next sync at {status.next_scheduled_at.strftime('%H:%M:%S')}")
+
 
-    st.title("Settings")
+def settings(budget_data: BudgetData, sync_worker: SyncWorker) -> None:
+    st.title("💰 Budget Planner: Settings")
 
     st.divider()
     refresh_containter = st.container(border=True)
     refresh_containter.subheader("Refresh budget data")
-    refresh_trans = refresh_containter.button(
+    # The buttons only queue a sync for the worker, so the page stays responsive
+    # and the previous data is shown until the sync finishes.
+    refresh_containter.button(
         "Refresh transactions",
-        on_click=budget_data.refresh_transactions(),
+        on_click=sync_worker.enqueue,
+        args=(SyncTask.TRANSACTIONS,),
         use_container_width=True,
     )
-    # if refresh_trans:
-    #     refresh_containter.write("Refreshing transactions..")
-    #     budget_data.refresh_transactions()
-    refresh_acc = refresh_containter.button(
+    refresh_containter.button(
+        "Reload all transactions",
+        on_click=sync_worker.enqueue,
+        args=(SyncTask.FULL_REFRESH,),
+        use_container_width=True,
+    )
+    refresh_containter.button(
         "Refresh accounts",
-        on_click=budget_data.refresh_accounts(),
+        on_click=sync_worker.enqueue,
+        args=(SyncTask.ACCOUNTS,),
         use_container_width=True,
     )
-    # if refresh_acc:
-    #     refresh_containter.write("Refreshing accounts..")
-    #     budget_data.refresh_accounts()
+    with refresh_containter:
+        sync_status(sync_worker)
+
+
+if __name__ == "__main__":
+    # Generate sample transactions
+    budget_data = BudgetDataMock()
+    settings(budget_data, SyncWorker(budget_data).start())
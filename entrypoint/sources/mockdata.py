@@ -1,14 +1,52 @@
-import random
-from datetime import datetime, timedelta
+import binascii
+import threading
+from collections.abc import Callable
+from datetime import date, datetime
 
+import numpy as np
 import pandas as pd
-from config import TransactionSchema, TransactionTypes
+import pyarrow as pa
+import pyarrow.compute as pc
+import timing
+from config import (
+    VALIDATION_SAMPLE_SIZE,
+    BudgetPeriod,
+    TransactionSchema,
+    TransactionTypes,
+    ValidationMode,
+)
 from faker import Faker
+from metrics import (
+    calculate_budget_metrics,
+    calculate_period_spend,
+    calculate_rolling_trend,
+)
+
+# Company names drawn from for transaction descriptions.
+COMPANY_POOL_SIZE = 1_000
+ACCOUNTS = ["Checking", "Credit Card"]
+STATUSES = ["cleared", "pending"]
 
 
 class BudgetDataMock:
-    def __init__(self):
-        self.fake = Faker()
+    def __init__(
+        self,
+        validation: ValidationMode = ValidationMode.INGEST,
+        seed: int = 0,
+        transactions_per_day: tuple[int, int] = (2, 5),
+    ):
+        """
+        validation: ValidationMode: when transactions are validated. By default
+            each year of transactions is validated once, when it is generated.
+        seed: int: seed of the random transactions. A seed always generates the
+            same transactions for the same days.
+        transactions_per_day: tuple[int, int]: the least and most transactions
+            generated for each day.
+        """
+        self.validation = validation
+        self.generation = 0
+        self.seed = seed
+        self.transactions_per_day = transactions_per_day
         self.categories = {
             "Income": ["Wages", "Dividends", "Rent"],
             "Housing": ["Rent", "Mortgage", "Insurance", "Maintenance"],
@@ -31,6 +69,15 @@ class BudgetDataMock:
             "Shopping": (20, 300),
             "Other": (10, 200),
         }
+        fake = Faker()
+        fake.seed_instance(seed)
+        self.companies = pa.array(
+            [fake.company() for _ in range(COMPANY_POOL_SIZE)], pa.string()
+        )
+        # Transactions are generated a calendar year at a time and kept, so each
+        # call only slices and filters them.
+        self._years: dict[int, pd.DataFrame] = {}
+        self._lock = threading.Lock()
 
     def get_transactions(
         self,
@@ -41,58 +88,199 @@ class BudgetDataMock:
         excluded_subcategories: list[str] = None,
         validate_transactions: bool = True,
     ) -> pd.DataFrame:
-        transactions = []
-        current_date = start_date
-
-        while current_date <= end_date:
-            # Generate 2-5 transactions per day
-            daily_transactions = random.randint(2, 5)
-
-            for _ in range(daily_transactions):
-                category = random.choice(list(self.categories.keys()))
-                subcategory = random.choice(self.categories[category])
-                amount_range = self.category_ranges[category]
-
-                transaction = {
-                    "id": self.fake.uuid4(),
-                    "created_date": current_date.strftime("%Y-%m-%d"),
-                    "description": f"{self.fake.company()} - {subcategory}",
-                    "type": (
-                        TransactionTypes.INCOME
-                        if category == "Income"
-                        else TransactionTypes.PURCHASE
-                    ),
-                    "category": category,
-                    "subcategory": subcategory,
-                    "amount": round(random.uniform(*amount_range), 2),
-                    "account": random.choice(["Checking", "Credit Card"]),
-                    "status": random.choice(["cleared", "pending"]),
-                }
-                transactions.append(transaction)
-
-            current_date += timedelta(days=1)
-        df = pd.DataFrame(transactions)
-        if account:
-            df = df[df["account"] == account]
-        if excluded_categories:
-            df = df[-df["category"].isin(excluded_categories)]
-        if excluded_subcategories:
-            _excluded_subcategories = [x.split(":")[1] for x in excluded_subcategories]
-            df = df[-df["subcategory"].isin(_excluded_subcategories)]
+        start_date, end_date = _as_date(start_date), _as_date(end_date)
+        years = [
+            self._transactions_in(year)
+            for year in range(start_date.year, end_date.year + 1)
+        ]
+        df = years[0] if len(years) == 1 else pd.concat(years, ignore_index=True)
+        with timing.span("mockdata.filter", rows_in=len(df)) as span:
+            created_date = df["created_date"]
+            mask = (created_date >= pd.Timestamp(start_date, tz="UTC")) & (
+                created_date < pd.Timestamp(end_date, tz="UTC") + pd.Timedelta(days=1)
+            )
+            if account:
+                mask &= df["account"] == account
+            if excluded_categories:
+                mask &= ~df["category"].isin(excluded_categories)
+            if excluded_subcategories:
+                _excluded = [x.split(":")[1] for x in excluded_subcategories]
+                mask &= ~df["subcategory"].isin(_excluded)
+            df = df[mask]
+            span.rows_out = len(df)
         if validate_transactions:
-            self._validate_transactions(df)
+            df = self._validate_transactions(df)
         return df
 
+    def _transactions_in(self, year: int) -> pd.DataFrame:
+        """Returns the transactions of a year, generating them the first time."""
+        with self._lock:
+            if year not in self._years:
+                with timing.span(f"mockdata.generate_{year}") as span:
+                    df = self._generate(year)
+                    if self.validation == ValidationMode.INGEST:
+                        df = TransactionSchema.validate_df(df, errors="raise")
+                    span.rows_out = len(df)
+                self._years[year] = df
+            return self._years[year]
+
+    def _generate(self, year: int) -> pd.DataFrame:
+        """Generate a year of random transactions, sorted by date.
+
+        The random generator is seeded with the source's seed and the year, so a
+        year's transactions don't depend on the other years generated.
+        """
+        rng = np.random.default_rng([self.seed, year])
+        days = np.arange(
+            np.datetime64(f"{year}-01-01"),
+            np.datetime64(f"{year + 1}-01-01"),
+            dtype="datetime64[D]",
+        )
+        fewest, most = self.transactions_per_day
+        days = np.repeat(days, rng.integers(fewest, most + 1, len(days)))
+        size = len(days)
+
+        # Pick a category, then one of its subcategories from a flat array of
+        # every category's subcategories.
+        categories = list(self.categories)
+        subcategories = [self.categories[category] for category in categories]
+        counts = np.array([len(values) for values in subcategories])
+        offsets = np.cumsum(counts) - counts
+        category = rng.integers(0, len(categories), size)
+        choice = (rng.random(size) * counts[category]).astype(int)
+        subcategory = offsets[category] + choice
+        subcategory_names = pa.array(np.concatenate(subcategories), pa.string())
+        low, high = np.array([self.category_ranges[name] for name in categories]).T
+        amount = np.round(low[category] + rng.random(size) * (high - low)[category], 2)
+        # Random 128 bit ids, hex encoded straight into an Arrow string buffer.
+        ids = pa.StringArray.from_buffers(
+            size,
+            pa.py_buffer(np.arange(0, 32 * (size + 1), 32, dtype=np.int32)),
+            pa.py_buffer(binascii.hexlify(rng.bytes(16 * size))),
+        )
+        description = pc.binary_join_element_wise(
+            self.companies.take(rng.integers(0, len(self.companies), size)),
+            subcategory_names.take(subcategory),
+            " - ",
+        )
+        types = np.where(
+            np.array(categories) == "Income",
+            TransactionTypes.INCOME.value,
+            TransactionTypes.PURCHASE.value,
+        )
+        table = pa.table(
+            {
+                "id": ids,
+                "created_date": pa.array(days.astype("datetime64[ns]")).cast(
+                    pa.timestamp("ns", tz="UTC")
+                ),
+                "description": description,
+                "type": pa.array(types[category], pa.string()),
+                "category": pa.array(categories, pa.string()).take(category),
+                "subcategory": subcategory_names.take(subcategory),
+                "amount": amount,
+                "account": pa.array(ACCOUNTS).take(
+                    rng.integers(0, len(ACCOUNTS), size)
+                ),
+                "status": pa.array(STATUSES).take(rng.integers(0, len(STATUSES), size)),
+            }
+        )
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+    def get_largest_transactions(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+        limit: int = 10,
+    ) -> pd.DataFrame:
+        df = self.get_transactions(
+            start_date,
+            end_date,
+            account,
+            excluded_categories,
+            excluded_subcategories,
+            validate_transactions=False,
+        )
+        return df[df["type"] != TransactionTypes.INCOME].nlargest(limit, "amount")
+
+    def get_metrics(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+    ) -> dict:
+        return calculate_budget_metrics(
+            self.get_transactions(
+                start_date,
+                end_date,
+                account,
+                excluded_categories,
+                excluded_subcategories,
+            )
+        )
+
+    def get_rolling_trend(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+        window_days: int = 30,
+        types: list[str] = None,
+    ) -> pd.DataFrame:
+        return calculate_rolling_trend(
+            self.get_transactions(
+                start_date,
+                end_date,
+                account,
+                excluded_categories,
+                excluded_subcategories,
+            ),
+            start_date,
+            end_date,
+            window_days,
+            types,
+        )
+
+    def get_period_spend(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+        period: BudgetPeriod = BudgetPeriod.MONTH,
+        group_by: str = "category",
+    ) -> dict:
+        return calculate_period_spend(
+            self.get_transactions(
+                start_date,
+                end_date,
+                account,
+                excluded_categories,
+                excluded_subcategories,
+            ),
+            period,
+            group_by,
+        )
+
     def get_categories(self) -> list[str]:
         """Returns a idempptent list of categories"""
         return list(self.categories.keys())
 
     def get_subcategories(self) -> list[str]:
         """Returns a idempptent list of subcategories"""
-        subcategories = []
-        for value in self.categories.values():
-            subcategories.append(value)
-        return subcategories.sort()
+        return sorted(
+            f"{category}:{subcategory}"
+            for category, subcategories in self.categories.items()
+            for subcategory in subcategories
+        )
 
     def get_accounts(self) -> list[str]:
         return ["Checking", "Credit Card"]
@@ -108,17 +296,41 @@ class BudgetDataMock:
             }
         )
 
-    def refresh_transactions(self) -> None:
-        """Refresh transactions data"""
+    def cursor(self) -> "BudgetDataMock":
+        """Mock data has no connection, so sessions can share the source."""
+        return self
+
+    def close(self) -> None:
         pass
 
+    def refresh_transactions(
+        self, full_refresh: bool = False, progress: Callable[[int], None] = None
+    ) -> int:
+        """Refresh transactions data"""
+        self.generation += 1
+        return 0
+
     def refresh_accounts(self) -> None:
         """Refresh accounts data"""
-        pass
+        self.generation += 1
 
     def _validate_transactions(self, df):
-        # validate transactions
-        TransactionSchema.parse_df(
-            dataframe=df,
-            errors="raise",
-        )
+        if self.validation in (ValidationMode.OFF, ValidationMode.INGEST):
+            return df
+        with timing.span("mockdata.validate_transactions", rows_in=len(df)) as span:
+            df = TransactionSchema.validate_df(
+                df,
+                errors="raise",
+                sample_size=(
+                    VALIDATION_SAMPLE_SIZE
+                    if self.validation == ValidationMode.SAMPLE
+                    else None
+                ),
+            )
+            span.rows_out = len(df)
+        return df
+
+
+def _as_date(value: date) -> date:
+    """Returns the date of a date or datetime."""
+    return value.date() if isinstance(value, datetime) else value
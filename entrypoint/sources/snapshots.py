@@ -0,0 +1,175 @@
+"""Database snapshots.
+
+Keep a duckdb database as a series of immutable generation files, so one writer
+can sync while any number of sessions and processes read the last generation.
+
+The writer's lock is a POSIX `fcntl` lock, so snapshot stores aren't available on
+Windows. Check `SNAPSHOTS_SUPPORTED` before creating one.
+"""
+
+import os
+import re
+import shutil
+import sys
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+import duckdb
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Whether the platform has the file locks a snapshot store's writer needs.
+SNAPSHOTS_SUPPORTED = fcntl is not None
+
+# Names the generation that is current.
+POINTER_FILE = "CURRENT"
+# Held by the writer while it writes a generation.
+LOCK_FILE = "writer.lock"
+GENERATION_FILE = "gen-{:06d}.duckdb"
+GENERATION_PATTERN = re.compile(r"gen-(\d+)\.duckdb")
+# Generations kept, including the current one, for readers still on an old one.
+KEEP_GENERATIONS = 3
+
+
+class WriterBusyError(RuntimeError):
+    """Raised when another writer is already writing a generation."""
+
+
+class UnchangedGeneration(Exception):
+    """Raised by a write block that changed nothing, to discard the generation
+    rather than swap it in."""
+
+
+class SnapshotStore:
+    """Generations of a duckdb database, written by one writer and read by many.
+
+    A writer copies the current generation to a new file, writes to it, and swaps
+    it in by replacing the pointer file, so readers only ever open complete
+    generations, read only. duckdb lets any number of processes read a file that
+    none of them is writing, so a sync, a notebook and the dashboard can all use
+    the store at once. Only one writer, in any process, writes at a time.
+
+    Each write copies the whole current generation, so it costs time in
+    proportion to the size of the database, however little it changes. A write
+    that changes nothing can be discarded, so readers keep the generation, and
+    the caches and prepared statements they have for it.
+    """
+
+    def __init__(self, directory: str | Path, initial: str | Path | None = None):
+        """
+        directory: str | Path: directory the generations are kept in.
+        initial: str | Path | None: database file copied as the first generation,
+            if the store has no generation yet.
+        """
+        if not SNAPSHOTS_SUPPORTED:
+            raise NotImplementedError(f"Snapshot stores need fcntl file locks, which {sys.platform} doesn't have")
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.initial = Path(initial) if initial else None
+        if self.generation == 0 and self.initial and self.initial.exists():
+            with self.write():
+                pass
+
+    @property
+    def generation(self) -> int:
+        """The number of the current generation, or 0 if there is none yet."""
+        try:
+            name = (self.directory / POINTER_FILE).read_text().strip()
+        except FileNotFoundError:
+            return 0
+        return int(GENERATION_PATTERN.fullmatch(name).group(1))
+
+    def path(self, generation: int) -> Path:
+        return self.directory / GENERATION_FILE.format(generation)
+
+    def connect(self) -> tuple[int, duckdb.DuckDBPyConnection]:
+        """Open a read only connection to the current generation.
+
+        Returns the generation and the connection, which is to an empty in memory
+        database if the store has no generation yet.
+        """
+        generation = self.generation
+        if generation == 0:
+            return 0, duckdb.connect()
+        return generation, duckdb.connect(self.path(generation), read_only=True)
+
+    @contextmanager
+    def write(self, block: bool = True) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Write the next generation, swapping it in if the block succeeds.
+
+        If the block raises `UnchangedGeneration` the generation is discarded, and
+        the current one is kept.
+
+        Args:
+            block: wait for another writer to finish, rather than raise a
+                `WriterBusyError`.
+
+        Yields:
+            duckdb.DuckDBPyConnection: A connection to a copy of the current
+                generation. It is closed when the block exits.
+        """
+        with (self.directory / LOCK_FILE).open("w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | (0 if block else fcntl.LOCK_NB))
+            except BlockingIOError:
+                raise WriterBusyError(f"Another writer is writing to {self.directory}") from None
+            current = self.generation
+            path = self.path(current + 1)
+            source = self.path(current) if current else self.initial
+            # Left behind if a writer was killed part way.
+            _remove_database(path)
+            try:
+                if source is not None and source.exists():
+                    _copy_database(source, path)
+                conn = duckdb.connect(path, read_only=False)
+                try:
+                    yield conn
+                    conn.checkpoint()
+                finally:
+                    conn.close()
+            except UnchangedGeneration:
+                _remove_database(path)
+                return
+            except BaseException:
+                _remove_database(path)
+                raise
+            self._swap(path.name)
+            self._remove_old(current + 1)
+
+    def _swap(self, name: str) -> None:
+        """Point readers at a generation, atomically."""
+        pointer = self.directory / POINTER_FILE
+        staged = pointer.with_suffix(".tmp")
+        with staged.open("w") as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(staged, pointer)
+
+    def _remove_old(self, current: int) -> None:
+        """Remove the generations older than the ones kept.
+
+        Readers that still have a removed generation open keep reading it, and
+        open the current one when they next notice the generation has changed.
+        """
+        for path in self.directory.glob("gen-*.duckdb"):
+            match = GENERATION_PATTERN.fullmatch(path.name)
+            if match and int(match.group(1)) <= current - KEEP_GENERATIONS:
+                _remove_database(path)
+
+
+def _copy_database(source: Path, target: Path) -> None:
+    """Copy a closed database file, and its write ahead log if it has one."""
+    shutil.copyfile(source, target)
+    wal = source.with_name(source.name + ".wal")
+    if wal.exists():
+        shutil.copyfile(wal, target.with_name(target.name + ".wal"))
+
+
+def _remove_database(path: Path) -> None:
+    path.unlink(missing_ok=True)
+    path.with_name(path.name + ".wal").unlink(missing_ok=True)
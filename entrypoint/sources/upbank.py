@@ -3,20 +3,62 @@
 Use the Up Bank API to retrieve transactions.
 """
 
+import copy
 import datetime
-import json
+import email.utils
+import queue
+import random
+import threading
+import time
+import weakref
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 from enum import StrEnum
 from pathlib import Path
 
 import duckdb
+import pandas as pd
+import pyarrow as pa
 import requests
-from config import TransactionSchema, TransactionTypes
+import timing
+from config import (
+    VALIDATION_SAMPLE_SIZE,
+    BudgetPeriod,
+    TransactionSchema,
+    TransactionTypes,
+    ValidationMode,
+)
+from metrics import metrics_from_rollup, period_spend_from_totals
+from requests.adapters import HTTPAdapter
+from sources.snapshots import SnapshotStore, UnchangedGeneration
 
 URL = "https://api.up.com.au/api/v1"
 
 # Maximum number of transactions upbank return per 'page'.
 PAGE_SIZE = 100
 HIST_DATA_LOAD_DAYS = 366
+# Days of older history loaded, and committed, at a time by a backfill.
+BACKFILL_CHUNK_DAYS = 30
+# Transactions created this many days before an account's high-water mark are
+# fetched again on an incremental sync, so late settling transactions are kept.
+SYNC_OVERLAP_DAYS = 7
+# Number of date windows fetched concurrently when loading the full history.
+FETCH_WORKERS = 4
+# Transactions are moved to the Parquet archive once the month they were created
+# in ended more than this many days ago.
+ARCHIVE_AFTER_DAYS = 90
+# Retry policy for rate limited (429) and failed (5xx) requests.
+MAX_RETRIES = 6
+BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 60
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# When a response says fewer requests than this are left in the rate limit, every
+# thread pauses, so the requests still in flight aren't throttled.
+RATE_LIMIT_RESERVE = FETCH_WORKERS
+RATE_LIMIT_PAUSE_SECONDS = 1.0
+REQUEST_TIMEOUT_SECONDS = 30
 INCOME_TYPES = [
     "Direct Credit",
     "Osko Payment Received",
@@ -33,8 +75,132 @@ EXPENSE_TYPES = [
     "Payment",
     "ATM Operator Fee",
 ]
-UP_ACCOUNT_ID = "70f21552-9d8d-48a5-ab54-35d34faf19e9"
-TWOUP_ACCOUNT_ID = "c176950d-d9e3-4918-ad9a-46b9cc4f9b6a"
+# Accounts of this type are the ones the budget app shows, not savers.
+BUDGET_ACCOUNT_TYPE = "TRANSACTIONAL"
+
+# The parts of Up's JSON:API resources that are loaded into duckdb. Fields that
+# are not listed are dropped when a page is converted to an Arrow batch.
+_RELATIONSHIP = pa.struct(
+    [("data", pa.struct([("type", pa.string()), ("id", pa.string())]))]
+)
+_MONEY = pa.struct(
+    [
+        ("currencyCode", pa.string()),
+        ("value", pa.string()),
+        ("valueInBaseUnits", pa.int64()),
+    ]
+)
+TRANSACTIONS_SCHEMA = pa.schema(
+    [
+        ("type", pa.string()),
+        ("id", pa.string()),
+        (
+            "attributes",
+            pa.struct(
+                [
+                    ("status", pa.string()),
+                    ("rawText", pa.string()),
+                    ("description", pa.string()),
+                    ("message", pa.string()),
+                    ("isCategorizable", pa.bool_()),
+                    ("amount", _MONEY),
+                    ("settledAt", pa.string()),
+                    ("createdAt", pa.string()),
+                    ("transactionType", pa.string()),
+                ]
+            ),
+        ),
+        (
+            "relationships",
+            pa.struct(
+                [
+                    ("account", _RELATIONSHIP),
+                    ("category", _RELATIONSHIP),
+                    ("parentCategory", _RELATIONSHIP),
+                ]
+            ),
+        ),
+    ]
+)
+CATEGORIES_SCHEMA = pa.schema(
+    [
+        ("type", pa.string()),
+        ("id", pa.string()),
+        ("attributes", pa.struct([("name", pa.string())])),
+        ("relationships", pa.struct([("parent", _RELATIONSHIP)])),
+    ]
+)
+# Flattened transactions table, with the Up transaction types mapped onto the
+# budget app's transaction types and categories when the transactions are loaded.
+# Categories and accounts are kept by id, and named by the dimension tables.
+TRANSACTIONS_COLUMNS = {
+    "id": "VARCHAR",
+    "created_date": "TIMESTAMP WITH TIME ZONE",
+    "settled_date": "TIMESTAMP WITH TIME ZONE",
+    "type": "VARCHAR",
+    "transaction_type": "VARCHAR",
+    "description": "VARCHAR",
+    "category": "VARCHAR",
+    "subcategory": "VARCHAR",
+    "amount_cents": "BIGINT",
+    "account_id": "VARCHAR",
+    "status": "VARCHAR",
+}
+# Daily rollup of the transactions table, summed by every column the sidebar
+# filters and the aggregates group by. It is kept up to date as transactions are
+# loaded, so aggregates scan a row per day and category rather than a row per
+# transaction. Amounts are absolute, like the amounts the budget app shows.
+DAILY_TOTALS_COLUMNS = {
+    "day": "DATE",
+    "type": "VARCHAR",
+    "category": "VARCHAR",
+    "subcategory": "VARCHAR",
+    "account_id": "VARCHAR",
+    "amount_cents": "BIGINT",
+}
+# The where clauses shared by the queries filtered from the sidebar. Queries that
+# only need the columns of the rollup read `daily_totals`, and queries that need
+# the transactions themselves, such as their id or description, read
+# `named_transactions`. Both filter by the ids of the categories and accounts,
+# looked up from the names picked in the sidebar, before their names are joined.
+TRANSACTION_FILTERS = """
+    created_date >= $start_date and
+    created_date < $end_date + 1 and
+    category_id is not null and
+    not list_contains($excluded_categories, category_id) and
+    not list_contains($excluded_subcategories, subcategory_id) and
+    list_contains($accounts, account_id)
+"""
+DAILY_TOTALS_FILTERS = """
+    day >= $start_date and
+    day <= $end_date and
+    category is not null and
+    not list_contains($excluded_categories, category) and
+    not list_contains($excluded_subcategories, subcategory) and
+    list_contains($accounts, account_id)
+"""
+# Prunes the archive's Hive partitions to the months of the filtered dates.
+ARCHIVE_FILTERS = """
+    year * 100 + month between $start_month and $end_month
+"""
+ACCOUNTS_SCHEMA = pa.schema(
+    [
+        ("type", pa.string()),
+        ("id", pa.string()),
+        (
+            "attributes",
+            pa.struct(
+                [
+                    ("displayName", pa.string()),
+                    ("accountType", pa.string()),
+                    ("ownershipType", pa.string()),
+                    ("balance", _MONEY),
+                    ("createdAt", pa.string()),
+                ]
+            ),
+        ),
+    ]
+)
 
 
 class TransactionStatus(StrEnum):
@@ -42,29 +208,101 @@ class TransactionStatus(StrEnum):
     SETTLED = "SETTLED"
 
 
+@dataclass
+class ClientStats:
+    """Running totals of the requests sent by an `UpbankClient`."""
+
+    requests: int = 0
+    retries: int = 0
+    bytes: int = 0
+    latency_seconds: float = 0.0
+    max_latency_seconds: float = 0.0
+    rate_limit_remaining: int | None = None
+    rate_limit_pauses: int = 0
+
+    @property
+    def mean_latency_seconds(self) -> float:
+        return self.latency_seconds / self.requests if self.requests else 0.0
+
+
+@dataclass
+class BackfillChunk:
+    """A chunk of history loaded by a backfill."""
+
+    since: datetime.datetime
+    until: datetime.datetime
+    transactions: int
+    seconds: float
+
+    @property
+    def transactions_per_second(self) -> float:
+        return self.transactions / self.seconds if self.seconds else 0.0
+
+
 class UpbankClient:
-    def __init__(self, token: str):
+    def __init__(
+        self,
+        token: str,
+        base_url: str = URL,
+        max_retries: int = MAX_RETRIES,
+        pool_size: int = FETCH_WORKERS * 2,
+    ):
         """
         token: str: upbank "personal access token" from https://api.up.com.au/getting_started
+        base_url: str: root of the Up API, override to point at a local stub.
+        max_retries: int: attempts made after a rate limited or failed request.
+        pool_size: int: number of keep-alive connections held open to the API.
         """
         self.token = token
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.stats = ClientStats()
+        self.session = requests.Session()
+        self.session.headers.update(self._headers())
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        # Monotonic time before which no request is sent, shared by all threads.
+        self._resume_at = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        """Close the pooled connections."""
+        self.session.close()
 
     def transactions(
         self,
         since: datetime.datetime,
         until: datetime.date | None = None,
         status: TransactionStatus | None = None,
-    ) -> list:
-        """Fetch a list of transactions.
+        account_id: str | None = None,
+        windows: int = 1,
+        max_workers: int = FETCH_WORKERS,
+    ) -> Iterator[list[dict]]:
+        """Fetch pages of transactions.
 
         Args:
             since: tzaware datetime to start from
             until: tzaware datetime to stop at; or None for all.
             status: "HELD" or "SETTLED"
+            account_id: only fetch transactions for this account; or None for all.
+            windows: split the date range into this many windows and follow each
+                window's pages concurrently.
+            max_workers: maximum number of windows fetched at the same time.
 
-        Returns:
-            list of "SETTLED" transactions in dict format.
+        Yields:
+            pages of transactions in dict format.
         """
+        if windows > 1:
+            return self._transactions_by_window(
+                since, until, status, account_id, windows, max_workers
+            )
         params = dict()
 
         # Upbank only return PAGE_SIZE transactions per request, so we need to
@@ -74,32 +312,94 @@ class UpbankClient:
             params.update({"filter[until]": until})
         if status is not None:
             params.update({"filter[status]": status})
-        response = self.get("/transactions", params=params)
+        path = "/transactions"
+        if account_id is not None:
+            path = f"/accounts/{account_id}/transactions"
+        response = self.get(path, params=params)
         return response
 
-    def get(self, path, params: dict = None) -> list:
-        """Send a GET request to Up.
+    def _transactions_by_window(
+        self,
+        since: datetime.datetime,
+        until: datetime.datetime | None,
+        status: TransactionStatus | None,
+        account_id: str | None,
+        windows: int,
+        max_workers: int,
+    ) -> Iterator[list[dict]]:
+        """Fetch transactions in date windows using a pool of threads.
+
+        Pages are yielded in the order they arrive from any window. At most
+        `max_workers` pages are buffered, so the caller sets the pace.
+
+        Yields:
+            pages of transactions, without ids already yielded.
+        """
+        if until is None:
+            until = datetime.datetime.now(tz=since.tzinfo)
+        step = (until - since) / windows
+        bounds = [until - step * i for i in range(windows)] + [since]
+        pages = queue.Queue(maxsize=max_workers)
+        stop = threading.Event()
+
+        def fetch(window_since, window_until):
+            for page in self.transactions(
+                window_since, window_until, status=status, account_id=account_id
+            ):
+                while not stop.is_set():
+                    try:
+                        pages.put(page, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+
+        # Windows overlap at their boundaries.
+        seen = set()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(fetch, bounds[i + 1], bounds[i])
+                for i in range(windows)
+            ]
+            try:
+                while not pages.empty() or not all(f.done() for f in futures):
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            raise future.exception()
+                    try:
+                        page = pages.get(timeout=0.1)
+                    except queue.Empty:
+                        continue
+                    page = [t for t in page if t["id"] not in seen]
+                    seen.update(t["id"] for t in page)
+                    if page:
+                        yield page
+                for future in futures:
+                    future.result()
+            finally:
+                stop.set()
+
+    def get(self, path, params: dict = None) -> Iterator[list]:
+        """Send a GET request to Up and follow the pagination links.
 
         Args:
             path: includes the preceding slash.
             params: request parameters.
 
-        Returns:
-            list of data; probably dicts.
+        Yields:
+            pages of data; probably dicts.
         """
-        result = []
-        uri = f"{URL}{path}"
+        uri = f"{self.base_url}{path}"
         while uri is not None:
-            response = requests.get(uri, headers=self._headers(), params=params)
-            data = response.json()
+            data = self._request(uri, params=params).json()
+            # The next link already carries the request parameters.
+            params = None
             try:
-                result.extend(data["data"])
+                yield data["data"]
                 uri = data["links"]["next"]
             except KeyError:
                 break
-            except Exception:
-                raise Exception
-        return result
 
     def ping(self):
         """Verify the access token is working.
@@ -107,66 +407,1095 @@ class UpbankClient:
         Returns:
             requests.Response
         """
-        return requests.get(f"{URL}/util/ping", headers=self._headers())
+        return self._request(f"{self.base_url}/util/ping")
+
+    def _request(self, uri: str, params: dict = None) -> requests.Response:
+        """Send a GET request, retrying rate limited and failed requests.
+
+        Retries back off exponentially with full jitter, unless the API says when
+        to retry with a `Retry-After` header. Requests also pause for
+        `RATE_LIMIT_PAUSE_SECONDS` once `X-RateLimit-Remaining` drops below
+        `RATE_LIMIT_RESERVE`, before the API starts throttling. A pause applies to
+        every thread sharing the client.
 
-    def accounts(self):
+        Raises:
+            requests.HTTPError: the request failed and can't be retried.
+            requests.RequestException: the retries were exhausted.
+        """
+        for attempt in range(self.max_retries + 1):
+            wait = self._resume_at - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            start = time.monotonic()
+            try:
+                response = self.session.get(
+                    uri, params=params, timeout=REQUEST_TIMEOUT_SECONDS
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+                self._record(time.monotonic() - start, retry=True)
+                time.sleep(self._backoff(attempt))
+                continue
+            retry = response.status_code in RETRY_STATUS_CODES
+            self._record(time.monotonic() - start, response, retry=retry)
+            if not retry or attempt == self.max_retries:
+                response.raise_for_status()
+                return response
+            delay = self._retry_after(response)
+            if delay is None:
+                delay = self._backoff(attempt)
+            with self._lock:
+                self._resume_at = max(self._resume_at, time.monotonic() + delay)
+
+    def _record(
+        self,
+        latency: float,
+        response: requests.Response | None = None,
+        retry: bool = False,
+    ) -> None:
+        with self._lock:
+            self.stats.requests += 1
+            self.stats.retries += retry
+            self.stats.latency_seconds += latency
+            self.stats.max_latency_seconds = max(
+                self.stats.max_latency_seconds, latency
+            )
+            if response is not None:
+                self.stats.bytes += len(response.content)
+                remaining = response.headers.get("X-RateLimit-Remaining")
+                if remaining is not None and remaining.isdigit():
+                    self.stats.rate_limit_remaining = int(remaining)
+                    if int(remaining) < RATE_LIMIT_RESERVE:
+                        now = time.monotonic()
+                        self.stats.rate_limit_pauses += self._resume_at <= now
+                        self._resume_at = max(
+                            self._resume_at, now + RATE_LIMIT_PAUSE_SECONDS
+                        )
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        return random.uniform(0, min(MAX_BACKOFF_SECONDS, BACKOFF_SECONDS * 2**attempt))
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> float | None:
+        """Seconds to wait from a `Retry-After` header of seconds or an HTTP date."""
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is None:
+            return None
+        if retry_after.isdigit():
+            return float(retry_after)
+        try:
+            retry_at = email.utils.parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        now = datetime.datetime.now(tz=retry_at.tzinfo)
+        return max((retry_at - now).total_seconds(), 0.0)
+
+    def accounts(self) -> list:
         """Fetch a list of accounts."""
-        return self.get("/accounts")
+        return [account for page in self.get("/accounts") for account in page]
 
-    def categories(self):
+    def categories(self) -> list:
         """Fetch a list of categories."""
-        return self.get("/categories")
+        return [category for page in self.get("/categories") for category in page]
 
     def _headers(self):
         return {"Authorization": f"Bearer {self.token}"}
 
 
+def _as_date(value: datetime.date) -> datetime.date:
+    """Truncate a datetime to its date; dates are returned unchanged."""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def _month_key(value: datetime.date) -> int:
+    """The year and month of a date as a number, such as 202407."""
+    return value.year * 100 + value.month
+
+
+def _ids_by_name(rows: list[tuple[str, str]]) -> dict[str, list[str]]:
+    """Group the ids of (name, id) rows by name, keeping the order of the names."""
+    ids = {}
+    for name, id_ in rows:
+        ids.setdefault(name, []).append(id_)
+    return ids
+
+
+def _ids(ids_by_name: dict[str, list[str]], names: list[str] | None) -> list[str]:
+    """Look up the ids of names, or of every name if names is None. A name that
+    isn't known is its own id."""
+    if names is None:
+        return [id_ for ids in ids_by_name.values() for id_ in ids]
+    return [id_ for name in names for id_ in ids_by_name.get(name, [name])]
+
+
+def _sql_literal(value) -> str:
+    """Render a prepared statement parameter as a duckdb literal."""
+    if value is None:
+        return "null"
+    if isinstance(value, list | tuple):
+        return f"[{', '.join(_sql_literal(v) for v in value)}]::varchar[]"
+    if isinstance(value, datetime.datetime):
+        return f"'{value.isoformat()}'::timestamptz"
+    if isinstance(value, datetime.date):
+        return f"'{value.isoformat()}'::date"
+    if isinstance(value, int | float):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+@dataclass
+class _SharedState:
+    """State shared by a `BudgetDataUp` and its cursors."""
+
+    generation: int = 0
+    # The generation the sidebar lookups were read from, and the lookups.
+    lookups: tuple[int, dict[str, list[str]]] | None = None
+
+
 class BudgetDataUp:
     def __init__(
-        self, api_client: UpbankClient, database_connection: str = "./db/db.duckdb"
+        self,
+        api_client: UpbankClient,
+        database_connection: (
+            str | Path | duckdb.DuckDBPyConnection | SnapshotStore
+        ) = "./db/db.duckdb",
+        sync_overlap_days: int = SYNC_OVERLAP_DAYS,
+        fetch_workers: int = FETCH_WORKERS,
+        validation: ValidationMode = ValidationMode.INGEST,
+        archive_directory: str | Path | None = None,
+        archive_after_days: int = ARCHIVE_AFTER_DAYS,
     ):
+        """
+        api_client: UpbankClient: client used to refresh the data.
+        database_connection: str | Path | duckdb.DuckDBPyConnection | SnapshotStore:
+            path of the duckdb database file, an open connection to it, or a
+            store of its generations. Through a store the source reads the
+            current generation, read only, and the refresh methods write the next.
+        sync_overlap_days: int: days before each account's high-water mark that
+            are fetched again on an incremental refresh.
+        fetch_workers: int: date windows fetched concurrently on a full refresh.
+        validation: ValidationMode: when transactions are validated. By default
+            they are validated as they are loaded, and trusted afterwards.
+        archive_directory: str | Path | None: directory old transactions are
+            archived to as Parquet; or None to keep every transaction in duckdb.
+        archive_after_days: int: days after the end of a month its transactions
+            are archived.
+        """
         self.client = api_client
-        self.conn = duckdb.connect(database=Path(database_connection), read_only=False)
+        self.store = None
+        self._conn = None
+        self._conn_generation = None
+        if isinstance(database_connection, SnapshotStore):
+            self.store = database_connection
+        elif isinstance(database_connection, duckdb.DuckDBPyConnection):
+            self._conn = database_connection
+        else:
+            self._conn = duckdb.connect(
+                database=Path(database_connection), read_only=False
+            )
+        self.sync_overlap = datetime.timedelta(days=sync_overlap_days)
+        self.fetch_workers = fetch_workers
+        self.validation = validation
+        self.archive_directory = Path(archive_directory) if archive_directory else None
+        self.archive_after = datetime.timedelta(days=archive_after_days)
+        self._shared = _SharedState()
+        self._prepared = set()
+        # The cursors opened on the source, closed with it.
+        self._cursors = weakref.WeakSet()
+        # Whether a writer has loaded transactions that differ from those it had.
+        self._transactions_changed = False
+        if self.store is None:
+            self._prepare_schema()
+        elif not self._schema_is_current():
+            # A generation written before the tables or views it lacks existed.
+            with self._writer():
+                pass
 
-    def refresh_categories(self):
-        """Get a list of transaction categories."""
-        # TODO: Implement
-        # response = client.categories()
-        # pprint.pformat(response)
+    @property
+    def conn(self) -> duckdb.DuckDBPyConnection:
+        """The connection the source queries.
 
-    def refresh_accounts(self):
-        """Fetch the current balance of the account."""
-        response = self.client.accounts()
-        if not response:
+        Through a snapshot store, a connection to the current generation, opened
+        again whenever a writer has swapped in a new one.
+        """
+        if self.store is not None and self._conn_generation != self.store.generation:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn_generation, self._conn = self.store.connect()
+            self._prepared = set()
+        return self._conn
+
+    @property
+    def generation(self) -> int:
+        if self.store is not None:
+            return self.store.generation
+        return self._shared.generation
+
+    def cursor(self) -> "BudgetDataUp":
+        """Returns a handle on the same database for one session or thread.
+
+        A duckdb connection can't run queries from several threads at once, but
+        each cursor can. Cursors share the client, settings and generation, and
+        prepare their own statements. Through a snapshot store each cursor opens
+        its own connection. Close a cursor when its session ends, to release its
+        connection and the generation it reads; closing the source closes any
+        cursors still open.
+        """
+        cursor = copy.copy(self)
+        cursor._conn = self.conn.cursor() if self.store is None else None
+        cursor._conn_generation = None
+        cursor._prepared = set()
+        cursor._cursors = weakref.WeakSet()
+        self._cursors.add(cursor)
+        return cursor
+
+    def close(self) -> None:
+        """Close the database connection, and those of the source's cursors."""
+        for cursor in list(self._cursors):
+            cursor.close()
+        if self._conn is not None:
+            self._conn.close()
+
+    @contextmanager
+    def _writer(self) -> Iterator["BudgetDataUp"]:
+        """Yields the source to refresh the data with.
+
+        Through a snapshot store, a copy of the source on the next generation,
+        which is swapped in if the block succeeds and changed the data; otherwise
+        the source itself.
+        """
+        if self.store is None:
+            yield self
             return
-        with open(Path("./db/accounts.json"), "w", encoding="utf-8") as f:
-            json.dump(response, f, ensure_ascii=False, indent=4)
+        with self.store.write() as conn:
+            writer = copy.copy(self)
+            writer.store = None
+            writer._conn = conn
+            writer._prepared = set()
+            writer._transactions_changed = False
+            before = writer._fingerprint() if writer._schema_is_current() else None
+            writer._prepare_schema()
+            yield writer
+            if (
+                before is not None
+                and not writer._transactions_changed
+                and writer._fingerprint() == before
+            ):
+                raise UnchangedGeneration
+
+    def _fingerprint(self) -> tuple:
+        """Returns the number of rows and the sum of their hashes in each of the
+        small tables a refresh writes, to tell whether it changed them.
+
+        The transactions are too many to hash on every sync, so `_load_batch`
+        tracks whether they changed instead. The daily totals are summed from the
+        transactions, and the times the sync and backfill state were last written
+        don't change the data, so they are left out.
+        """
+        return self.conn.sql(
+            """
+            select
+                (select (count(*), sum(hash(t))) from accounts as t),
+                (select (count(*), sum(hash(t))) from categories as t),
+                (select (count(*), sum(hash(t))) from subcategories as t),
+                (select (count(*), sum(hash(t))) from archive_months as t),
+                (select (count(*), sum(hash(since))) from backfill_state),
+                (
+                    select (count(*), sum(hash(account_id, high_water_mark)))
+                    from sync_state
+                )
+            """
+        ).fetchone()
+
+    def _prepare_schema(self) -> None:
+        """Create the tables and views the source reads and writes, and the daily
+        totals if they are out of date."""
         self.conn.sql(
             """
-            create or replace table accounts as (
-                select *
-                from read_json_auto('./db/accounts.json')
+            create table if not exists sync_state (
+                account_id varchar primary key,
+                high_water_mark timestamptz,
+                synced_at timestamptz
+            )
+            """
+        )
+        self.conn.sql(
+            """
+            create table if not exists backfill_state (
+                since timestamptz,
+                updated_at timestamptz
+            )
+            """
+        )
+        self.conn.sql(
+            """
+            create table if not exists archive_months (
+                year bigint,
+                month bigint,
+                path varchar
+            )
+            """
+        )
+        self.conn.sql(
+            """
+            create table if not exists categories (
+                id varchar,
+                name varchar
+            )
+            """
+        )
+        self.conn.sql(
+            """
+            create table if not exists subcategories (
+                id varchar,
+                name varchar,
+                category_id varchar
+            )
+            """
+        )
+        # Replaces the accounts table read_json_auto made, which has uuid ids.
+        if not self._schema_matches("accounts", self._schema_columns(ACCOUNTS_SCHEMA)):
+            self._create_table("accounts", ACCOUNTS_SCHEMA)
+        if not self._table_exists("archived_transactions"):
+            self._create_archive_view()
+        if not self._schema_matches("transactions", TRANSACTIONS_COLUMNS):
+            self._migrate_transactions()
+        if not self._schema_matches("daily_totals", DAILY_TOTALS_COLUMNS):
+            self._create_daily_totals()
+        self._create_named_views()
+
+    def _schema_is_current(self) -> bool:
+        """Whether the tables and views `_prepare_schema` creates are up to date."""
+        return all(
+            self._table_exists(table)
+            for table in (
+                "sync_state",
+                "backfill_state",
+                "archive_months",
+                "categories",
+                "subcategories",
+                "archived_transactions",
+                "named_transactions",
+            )
+        ) and all(
+            self._schema_matches(table, columns)
+            for table, columns in (
+                ("accounts", self._schema_columns(ACCOUNTS_SCHEMA)),
+                ("transactions", TRANSACTIONS_COLUMNS),
+                ("daily_totals", DAILY_TOTALS_COLUMNS),
             )
+        )
+
+    def _migrate_transactions(self) -> None:
+        """Bring a transactions table that isn't current up to date.
+
+        A table with the current columns, in order, and columns that have since
+        been dropped, such as the account names from before the accounts table
+        named them, keeps its transactions and loses the dropped columns. The
+        archive's view only reads the current columns of its files, so it keeps its
+        transactions too. Any other table is reset.
+        """
+        columns = []
+        if self._table_exists("transactions"):
+            columns = [
+                name for name, *_ in self.conn.sql("describe transactions").fetchall()
+            ]
+        current = [name for name in columns if name in TRANSACTIONS_COLUMNS]
+        if current != list(TRANSACTIONS_COLUMNS):
+            self._reset_transactions()
+            return
+        for name in columns:
+            if name not in TRANSACTIONS_COLUMNS:
+                self.conn.sql(f"alter table transactions drop column {name}")
+        self._create_archive_view()
+        if not self._schema_matches("transactions", TRANSACTIONS_COLUMNS):
+            self._reset_transactions()
+
+    def _reset_transactions(self) -> None:
+        """Replace the transactions with an empty table, and forget how far they
+        were synced, backfilled and archived, so the next sync loads them in full.
+
+        For a new database, or one with transactions in a table that isn't current,
+        such as the nested table the transactions were first loaded into. The files
+        of the forgotten archive are left for readers of older snapshots.
+        """
+        self.conn.sql("delete from sync_state")
+        self.conn.sql("delete from backfill_state")
+        self.conn.sql("delete from archive_months")
+        self._create_archive_view()
+        self._create_transactions_table()
+
+    def _create_named_views(self) -> None:
+        """Create the view naming the categories and accounts of the hot and archived
+        transactions, replacing it.
+
+        Transactions are kept by category and account id, and joined to the
+        dimension tables by id. Income isn't an Up category, so it keeps the
+        category and subcategory it was given when it was loaded, and transactions
+        of an account that isn't known yet are named by the account's id. Only the
+        archived transactions have a year and month, as finding them for the hot
+        transactions would cost more than the date filters they're read with.
+        """
+        self.conn.sql(
+            """
+            create or replace view named_transactions as
+            select
+                facts.id,
+                facts.created_date,
+                facts.settled_date,
+                facts.type,
+                facts.transaction_type,
+                facts.description,
+                facts.category as category_id,
+                facts.subcategory as subcategory_id,
+                facts.account_id,
+                coalesce(categories.name, facts.category) as category,
+                coalesce(subcategories.name, facts.subcategory) as subcategory,
+                coalesce(accounts.attributes.displayName, facts.account_id) as account,
+                facts.amount_cents,
+                facts.status,
+                facts.year,
+                facts.month
+            from (
+                select
+                    *,
+                    null::bigint as year,
+                    null::bigint as month
+                from transactions
+                union all by name
+                from archived_transactions
+            ) as facts
+            left join categories on categories.id = facts.category
+            left join subcategories on subcategories.id = facts.subcategory
+            left join accounts on accounts.id = facts.account_id
             """
         )
 
-    def refresh_transactions(self):
-        """Download held transactions."""
+    def refresh_categories(self):
+        """Fetch the categories and subcategories transactions are named by."""
+        with self._writer() as writer:
+            writer._refresh_dimensions(accounts=False)
+
+    def refresh_accounts(self):
+        """Fetch the accounts and their current balances."""
+        with self._writer() as writer:
+            writer._refresh_dimensions(categories=False)
+
+    def _refresh_dimensions(self, accounts: bool = True, categories: bool = True):
+        self.conn.begin()
+        try:
+            if accounts:
+                self._load_accounts(self.client.accounts())
+            if categories:
+                self._load_categories(self.client.categories())
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self._shared.generation += 1
+
+    def _load_accounts(self, accounts: list[dict]) -> None:
+        """Replace the accounts. Runs in the caller's transaction."""
+        self.conn.sql("delete from accounts")
+        self._insert_batch("accounts", accounts, ACCOUNTS_SCHEMA)
+
+    def _load_categories(self, categories: list[dict]) -> None:
+        """Replace the categories, which have no parent, and the subcategories.
+
+        Runs in the caller's transaction.
+        """
+        batch = pa.Table.from_pylist(categories, schema=CATEGORIES_SCHEMA)
+        self.conn.register("categories_batch", batch)
+        try:
+            self.conn.sql("delete from categories")
+            self.conn.sql("delete from subcategories")
+            self.conn.sql(
+                """
+                insert into categories
+                select
+                    id,
+                    attributes.name
+                from categories_batch
+                where relationships.parent.data is null
+                """
+            )
+            self.conn.sql(
+                """
+                insert into subcategories
+                select
+                    id,
+                    attributes.name,
+                    relationships.parent.data.id
+                from categories_batch
+                where relationships.parent.data is not null
+                """
+            )
+        finally:
+            self.conn.unregister("categories_batch")
+
+    def refresh_transactions(
+        self, full_refresh: bool = False, progress: Callable[[int], None] = None
+    ) -> int:
+        """Download settled transactions.
+
+        By default only the transactions created since each account's high-water
+        mark, less the overlap window, are downloaded and upserted by `id`. A full
+        refresh, or the first refresh of a new database, replaces the table with the
+        last `HIST_DATA_LOAD_DAYS` of transactions, and the backfill starts over.
+        The accounts and categories are refreshed with the transactions.
+
+        The refresh runs in one transaction, or writes the next generation of a
+        snapshot store, so readers keep querying the previous transactions until
+        the new ones are committed or swapped in at once.
+
+        Args:
+            full_refresh: reload the full history instead of syncing incrementally.
+            progress: called with the number of transactions loaded so far after
+                each page is loaded.
+
+        Returns:
+            int: The number of transactions loaded.
+        """
+        with self._writer() as writer:
+            return writer._refresh_transactions(full_refresh, progress)
+
+    def _refresh_transactions(
+        self, full_refresh: bool, progress: Callable[[int], None] | None
+    ) -> int:
         local_tz = datetime.datetime.now().astimezone().tzinfo
         now = datetime.datetime.now().replace(tzinfo=local_tz)
         since = now - datetime.timedelta(days=HIST_DATA_LOAD_DAYS)
-        response = self.client.transactions(since, status=TransactionStatus.SETTLED)
-        if not response:
+        loaded = 0
+
+        def load(pages: Iterator[list]) -> None:
+            nonlocal loaded
+            for page in pages:
+                self._load_batch(page)
+                loaded += len(page)
+                if progress is not None:
+                    progress(loaded)
+
+        self.conn.begin()
+        try:
+            # Transactions are named by the accounts and categories they are
+            # loaded with.
+            accounts = self.client.accounts()
+            self._load_accounts(accounts)
+            self._load_categories(self.client.categories())
+            watermarks = self._get_watermarks()
+            if full_refresh or not watermarks:
+                # The high-water marks are moved up by the load rather than deleted,
+                # as duckdb drops an upsert of a key deleted in the same transaction.
+                self._create_transactions_table()
+                self.conn.sql("delete from backfill_state")
+                load(
+                    self.client.transactions(
+                        since,
+                        now,
+                        status=TransactionStatus.SETTLED,
+                        windows=self.fetch_workers,
+                        max_workers=self.fetch_workers,
+                    )
+                )
+                # Pages arrive out of order, sort the rows so duckdb's row group
+                # min/max indexes can skip the dates outside a query's range.
+                self.conn.sql(
+                    """
+                    create or replace table transactions as
+                    from transactions
+                    order by created_date
+                    """
+                )
+            else:
+                for account in accounts:
+                    account_since = since
+                    if account["id"] in watermarks:
+                        account_since = watermarks[account["id"]] - self.sync_overlap
+                    load(
+                        self.client.transactions(
+                            account_since,
+                            status=TransactionStatus.SETTLED,
+                            account_id=account["id"],
+                        )
+                    )
+            self._archive_transactions()
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self._shared.generation += 1
+        return loaded
+
+    def backfill(
+        self, since: datetime.date | None = None, chunk_days: int = BACKFILL_CHUNK_DAYS
+    ) -> Iterator[BackfillChunk]:
+        """Load the settled transactions older than the synced history, newest first.
+
+        History is loaded in chunks of `chunk_days`, back from where the last
+        backfill stopped, or from `HIST_DATA_LOAD_DAYS` ago, to `since`. Each chunk
+        is committed, or swapped in as the next generation of a snapshot store,
+        with a checkpoint of how far back the backfill has reached before it is
+        yielded. So an interrupted backfill resumes from its last chunk, and the
+        dashboard shows the history loaded so far while it runs.
+
+        Args:
+            since: the date to load transactions from; or None for the date the
+                oldest account was opened.
+            chunk_days: days of transactions loaded in each chunk.
+
+        Yields:
+            BackfillChunk: Each chunk, once it is committed.
+        """
+        local_tz = datetime.datetime.now().astimezone().tzinfo
+        if since is None:
+            since = min(
+                datetime.datetime.fromisoformat(account["attributes"]["createdAt"])
+                for account in self.client.accounts()
+            )
+        else:
+            since = datetime.datetime.combine(since, datetime.time(), local_tz)
+        until = self._get_backfill_checkpoint()
+        if until is None:
+            until = datetime.datetime.now(local_tz) - datetime.timedelta(
+                days=HIST_DATA_LOAD_DAYS
+            )
+        step = datetime.timedelta(days=chunk_days)
+        while until > since:
+            chunk_since = max(until - step, since)
+            started = time.perf_counter()
+            with self._writer() as writer:
+                loaded = writer._backfill_chunk(chunk_since, until)
+            yield BackfillChunk(
+                chunk_since, until, loaded, time.perf_counter() - started
+            )
+            until = chunk_since
+
+    def _backfill_chunk(
+        self, since: datetime.datetime, until: datetime.datetime
+    ) -> int:
+        """Load a chunk of history and move the checkpoint back to its start."""
+        loaded = 0
+        self.conn.begin()
+        try:
+            self._load_accounts(self.client.accounts())
+            self._load_categories(self.client.categories())
+            for page in self.client.transactions(
+                since,
+                until,
+                status=TransactionStatus.SETTLED,
+                windows=self.fetch_workers,
+                max_workers=self.fetch_workers,
+            ):
+                self._load_batch(page)
+                loaded += len(page)
+            self._archive_transactions()
+            self.conn.sql("delete from backfill_state")
+            self.conn.execute("insert into backfill_state values (?, now())", [since])
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self._shared.generation += 1
+        return loaded
+
+    def _get_backfill_checkpoint(self) -> datetime.datetime | None:
+        """Returns the date the last backfill reached back to, if there was one."""
+        return self.conn.sql("select min(since) from backfill_state").fetchone()[0]
+
+    def _upsert_transactions(self, transactions: list[dict]) -> None:
+        """Upsert a batch of transactions in its own transaction."""
+        self.conn.begin()
+        try:
+            self._load_batch(transactions)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self._shared.generation += 1
+
+    def _load_batch(self, transactions: list[dict]) -> None:
+        """Insert new transactions and replace existing ones with the same `id`.
+
+        The daily totals of the days the batch adds to, or replaces transactions
+        from, are summed again, and the source notes whether the batch changed any
+        transaction. Runs in the caller's transaction.
+        """
+        batch = pa.Table.from_pylist(transactions, schema=TRANSACTIONS_SCHEMA)
+        self.conn.register("transactions_batch", batch)
+        try:
+            first_day, last_day = self.conn.sql(
+                """
+                select
+                    min(day),
+                    max(day)
+                from (
+                    select created_date::date as day
+                    from transactions
+                    where id in (select id from transactions_batch)
+                    union all
+                    select attributes.createdAt::timestamptz::date
+                    from transactions_batch
+                )
+                """
+            ).fetchone()
+            replaced = self.conn.sql(
+                """
+                delete from transactions
+                where id in (select id from transactions_batch)
+                returning *
+                """
+            ).arrow()
+            self.conn.sql(
+                f"""
+                insert into transactions
+                select
+                    id,
+                    attributes.createdAt::timestamptz as created_date,
+                    attributes.settledAt::timestamptz as settled_date,
+                    case
+                        when attributes.transactionType in $income_types
+                        then '{TransactionTypes.INCOME}'
+                        when attributes.transactionType in $expense_types
+                        then '{TransactionTypes.PURCHASE}'
+                    end as type,
+                    attributes.transactionType as transaction_type,
+                    attributes.description as description,
+                    case
+                        when attributes.transactionType in $income_types
+                        then '{TransactionTypes.INCOME}'
+                        else relationships.parentCategory.data.id
+                    end as category,
+                    case
+                        when attributes.transactionType in $income_types
+                        then attributes.description
+                        else relationships.category.data.id
+                    end as subcategory,
+                    attributes.amount.valueInBaseUnits as amount_cents,
+                    relationships.account.data.id as account_id,
+                    attributes.status as status
+                from transactions_batch
+                order by
+                    created_date
+                """,
+                params={"income_types": INCOME_TYPES, "expense_types": EXPENSE_TYPES},
+            )
+            if self.validation == ValidationMode.INGEST:
+                self._validate_batch()
+            if not self._transactions_changed:
+                self._transactions_changed = self._batch_changed(replaced)
+            if first_day is not None:
+                self._update_daily_totals(first_day, last_day)
+            self._update_watermarks("transactions_batch")
+        finally:
+            self.conn.unregister("transactions_batch")
+
+    def _batch_changed(self, replaced: pa.Table) -> bool:
+        """Whether the transactions loaded from the batch differ from the ones they
+        replaced."""
+        self.conn.register("replaced_transactions", replaced)
+        try:
+            return self.conn.sql(
+                """
+                with loaded as (
+                    from transactions
+                    where id in (select id from transactions_batch)
+                )
+                select
+                    (select count(*) from loaded) !=
+                    (select count(*) from replaced_transactions) or
+                    exists (from loaded except from replaced_transactions)
+                """
+            ).fetchone()[0]
+        finally:
+            self.conn.unregister("replaced_transactions")
+
+    def _validate_batch(self) -> None:
+        """Validate the transactions loaded from the batch, deleting invalid rows.
+
+        Only transactions the budget app can show are checked, by the ids of their
+        categories and account rather than their names.
+        """
+        df = (
+            self.conn.sql(
+                """
+                select
+                    id,
+                    created_date,
+                    type,
+                    description,
+                    category,
+                    subcategory,
+                    abs(amount_cents) / 100 as amount,
+                    account_id as account,
+                    status
+                from transactions
+                where
+                    id in (select id from transactions_batch) and
+                    category is not null and
+                    account_id is not null
+                """
+            )
+            .arrow()
+            .to_pandas(types_mapper=pd.ArrowDtype)
+        )
+        valid = TransactionSchema.validate_df(df, errors="filter")
+        invalid = df.loc[~df.index.isin(valid.index), "id"].tolist()
+        if invalid:
+            self.conn.execute(
+                "delete from transactions where list_contains(?, id)", [invalid]
+            )
+
+    def _create_transactions_table(self) -> None:
+        """Create an empty transactions table and daily totals, replacing both."""
+        columns = ", ".join(f"{k} {v}" for k, v in TRANSACTIONS_COLUMNS.items())
+        self.conn.sql(f"create or replace table transactions ({columns})")
+        self._create_daily_totals()
+
+    def _create_daily_totals(self) -> None:
+        """Create the daily totals table, summing every transaction."""
+        columns = ", ".join(f"{k} {v}" for k, v in DAILY_TOTALS_COLUMNS.items())
+        self.conn.sql(f"create or replace table daily_totals ({columns})")
+        self._insert_daily_totals()
+
+    def _update_daily_totals(
+        self, first_day: datetime.date, last_day: datetime.date
+    ) -> None:
+        """Sum the daily totals again for the days from first_day to last_day."""
+        self.conn.execute(
+            "delete from daily_totals where day between $first_day and $last_day",
+            {"first_day": first_day, "last_day": last_day},
+        )
+        self._insert_daily_totals(first_day, last_day)
+
+    def _insert_daily_totals(
+        self,
+        first_day: datetime.date = datetime.date.min,
+        last_day: datetime.date = datetime.date.max,
+    ) -> None:
+        """Sum the transactions, and the archived transactions, from first_day to
+        last_day into the daily totals."""
+        self.conn.execute(
+            f"""
+            insert into daily_totals
+            select
+                created_date::date as day,
+                type,
+                category,
+                subcategory,
+                account_id,
+                sum(abs(amount_cents))::bigint as amount_cents
+            from (
+                select
+                    created_date, type, category, subcategory, account_id, amount_cents
+                from transactions
+                union all
+                select
+                    created_date, type, category, subcategory, account_id, amount_cents
+                from archived_transactions
+                where {ARCHIVE_FILTERS}
+            )
+            where
+                created_date >= $start_date and
+                created_date < $end_date + 1
+            group by all
+            order by day
+            """,
+            {
+                "start_date": first_day,
+                "end_date": last_day,
+                "start_month": _month_key(first_day),
+                "end_month": _month_key(last_day),
+            },
+        )
+
+    def _archive_transactions(self) -> None:
+        """Move the transactions of months that ended long enough ago to the archive.
+
+        They are appended to the archive as zstd compressed Parquet partitioned by
+        year and month, so a month can be archived in parts, as a backfill loads
+        it. Settled transactions don't change, so the ones the archive already
+        has, such as those a full refresh loads again, are dropped.
+        """
+        if self.archive_directory is None:
             return
-        with open(Path("./db/transactions.json"), "w", encoding="utf-8") as f:
-            json.dump(response, f, ensure_ascii=False, indent=4)
-        self.conn.sql(
+        cutoff = (datetime.date.today() - self.archive_after).replace(day=1)
+        params = {"cutoff": cutoff}
+        first_day, last_day = self.conn.execute(
             """
-            create or replace table transactions as (
-                select *
-                from read_json_auto('./db/transactions.json')
+            select min(created_date)::date, max(created_date)::date
+            from transactions
+            where created_date < $cutoff
+            """,
+            params,
+        ).fetchone()
+        if first_day is None:
+            return
+        self.conn.execute(
+            f"""
+            delete from transactions
+            where
+                created_date < $cutoff and
+                id in (
+                    select id
+                    from archived_transactions
+                    where {ARCHIVE_FILTERS}
+                )
+            """,
+            {
+                **params,
+                "start_month": _month_key(first_day),
+                "end_month": _month_key(last_day),
+            },
+        )
+        months = self.conn.execute(
+            """
+            select distinct year(created_date), month(created_date)
+            from transactions
+            where created_date < $cutoff
+            """,
+            params,
+        ).fetchall()
+        if months:
+            # Each file is named uniquely, so it never replaces a file an older
+            # snapshot reads, and files left by a failed sync are never listed.
+            existing = {
+                path
+                for year, month in months
+                for path in self._archive_path(year, month).glob("*")
+            }
+            self.archive_directory.mkdir(parents=True, exist_ok=True)
+            self.conn.sql(
+                f"""
+                copy (
+                    select
+                        *,
+                        year(created_date) as year,
+                        month(created_date) as month
+                    from transactions
+                    where created_date < {_sql_literal(cutoff)}
+                    order by created_date
+                ) to {_sql_literal(str(self.archive_directory))} (
+                    format parquet,
+                    compression zstd,
+                    partition_by (year, month),
+                    filename_pattern 'data_{{uuid}}',
+                    overwrite_or_ignore true
+                )
+                """
+            )
+            self.conn.executemany(
+                "insert into archive_months values (?, ?, ?)",
+                [
+                    [year, month, str(path)]
+                    for year, month in months
+                    for path in sorted(
+                        set(self._archive_path(year, month).glob("*")) - existing
+                    )
+                ],
             )
+            self.conn.execute(
+                "delete from transactions where created_date < $cutoff", params
+            )
+            self._create_archive_view()
+        self._update_daily_totals(first_day, last_day)
+
+    def _archive_path(self, year: int, month: int) -> Path:
+        return self.archive_directory / f"year={year}" / f"month={month}"
+
+    def _create_archive_view(self) -> None:
+        """Create the view of the archived transactions, replacing it.
+
+        The view reads the files listed in `archive_months`, rather than every
+        file in the archive, so each snapshot reads the months it archived.
         """
+        paths = [
+            path
+            for (path,) in self.conn.sql(
+                "select path from archive_months order by year, month"
+            ).fetchall()
+        ]
+        if paths:
+            source = f"read_parquet({_sql_literal(paths)}, hive_partitioning = true)"
+        else:
+            columns = ", ".join(
+                f"null::{v} as {k}" for k, v in TRANSACTIONS_COLUMNS.items()
+            )
+            source = f"(select {columns}, null::bigint as year, null::bigint as month)"
+        columns = ", ".join(TRANSACTIONS_COLUMNS)
+        self.conn.sql(
+            f"""
+            create or replace view archived_transactions as
+            select {columns}, year, month
+            from {source}
+            where id is not null
+            """
+        )
+
+    def _create_table(self, table: str, schema: pa.Schema) -> None:
+        """Create an empty table, replacing any existing table, from a schema."""
+        self.conn.register("empty_batch", schema.empty_table())
+        try:
+            self.conn.sql(f"create or replace table {table} as from empty_batch")
+        finally:
+            self.conn.unregister("empty_batch")
+
+    def _insert_batch(self, table: str, rows: list[dict], schema: pa.Schema) -> None:
+        """Append rows to a table through an Arrow batch."""
+        self.conn.register("batch", pa.Table.from_pylist(rows, schema=schema))
+        try:
+            self.conn.sql(f"insert into {table} select * from batch")
+        finally:
+            self.conn.unregister("batch")
+
+    def _schema_columns(self, schema: pa.Schema) -> dict[str, str]:
+        """Returns the columns and types of a table created from a schema."""
+        self.conn.register("empty_batch", schema.empty_table())
+        try:
+            columns = self.conn.sql("describe empty_batch").fetchall()
+        finally:
+            self.conn.unregister("empty_batch")
+        return {name: dtype for name, dtype, *_ in columns}
+
+    def _schema_matches(self, table: str, columns: dict[str, str]) -> bool:
+        """Whether a table exists with exactly the given columns and types."""
+        if not self._table_exists(table):
+            return False
+        actual = self.conn.sql(f"describe {table}").fetchall()
+        return {name: dtype for name, dtype, *_ in actual} == columns
+
+    def _get_watermarks(self) -> dict[str, datetime.datetime]:
+        """Returns the latest synced transaction created date for each account."""
+        rows = self.conn.sql("select account_id, high_water_mark from sync_state")
+        return dict(rows.fetchall())
+
+    def _update_watermarks(self, table: str) -> None:
+        """Move each account's high-water mark to the newest transaction in table."""
+        self.conn.sql(
+            f"""
+            insert into sync_state
+            select
+                relationships.account.data.id as account_id,
+                max(attributes.createdAt::timestamptz) as high_water_mark,
+                now() as synced_at
+            from {table}
+            group by
+                account_id
+            on conflict (account_id) do update set
+                high_water_mark = greatest(high_water_mark, excluded.high_water_mark),
+                synced_at = excluded.synced_at
+            """
+        )
+
+    def _table_exists(self, table: str) -> bool:
+        return bool(
+            self.conn.execute(
+                "select count(*) from information_schema.tables where table_name = ?",
+                [table],
+            ).fetchone()[0]
         )
 
     def get_transactions(
@@ -178,56 +1507,16 @@ class BudgetDataUp:
         excluded_subcategories: list[str] = None,
         validate_transactions: bool = True,
     ):
-        included_accounts = self.get_accounts()
-        if account:
-            included_accounts = [account]
-        df = self.conn.sql(
+        params = self._filter_params(
+            start_date,
+            end_date,
+            account,
+            excluded_categories,
+            excluded_subcategories,
+        )
+        result = self._execute(
+            "get_transactions",
             f"""
-                with transform as (
-                    select
-                        id,
-                        attributes.createdAt as created_date,
-                        case
-                            when attributes.transactionType in ('{"','".join(INCOME_TYPES)}')
-                            then '{TransactionTypes.INCOME}'
-                            when attributes.transactionType in ('{"','".join(EXPENSE_TYPES)}')
-                            then '{TransactionTypes.PURCHASE}'
-                        end as type,
-                        attributes.description as description,
-                        case
-                            when attributes.transactionType in ('{"','".join(INCOME_TYPES)}')
-                            then '{TransactionTypes.INCOME}'
-                            else relationships.parentCategory.data.id
-                        end as category,
-                        case
-                            when attributes.transactionType in ('{"','".join(INCOME_TYPES)}')
-                            then '{TransactionTypes.INCOME}'
-                            else relationships.parentCategory.data.id
-                        end as category,
-                        case
-                            when attributes.transactionType in ('{"','".join(INCOME_TYPES)}')
-                            then attributes.description
-                            else relationships.category.data.id
-                        end as subcategory,
-                        abs(attributes.amount.value::DOUBLE) as amount,
-                        case
-                            when relationships.account.data.id = '{UP_ACCOUNT_ID}'
-                            then 'UP'
-                            when relationships.account.data.id = '{TWOUP_ACCOUNT_ID}'
-                            then '2UP'
-                        end as account,
-                        attributes.status as status
-                    from transactions
-                    where
-                        attributes.createdAt between '{start_date}' and '{end_date}' and
-                        (
-                            category is not null or
-                            attributes.transactionType in ('{"','".join(INCOME_TYPES)}')
-                        ) and
-                        category not in ('{"','".join(excluded_categories)}') and
-                        subcategory not in ('{"','".join(excluded_subcategories)}') and
-                        account in ('{"','".join(included_accounts)}')
-                )
                 select
                     id,
                     created_date,
@@ -235,81 +1524,423 @@ class BudgetDataUp:
                     description,
                     category,
                     subcategory,
-                    amount,
+                    abs(amount_cents) / 100 as amount,
                     account,
                     status
-                from transform
+                from named_transactions
+                where
+                    (year is null or {ARCHIVE_FILTERS}) and
+                    {TRANSACTION_FILTERS}
                 order by
                     created_date desc
-            """
-        ).df()
-        df = df.astype(
-            {
-                "id": str,
-                "created_date": str,
-                "type": str,
-                "description": str,
-                "category": str,
-                "subcategory": str,
-                "amount": float,
-                "account": str,
-                "status": str,
-            }
+            """,
+            **params,
+            start_month=_month_key(params["start_date"]),
+            end_month=_month_key(params["end_date"]),
         )
+        # Arrow backed columns wrap duckdb's result buffers instead of copying
+        # every string into a python object.
+        with timing.span("upbank.to_pandas") as span:
+            df = result.arrow().to_pandas(types_mapper=pd.ArrowDtype)
+            span.rows_out = len(df)
         if validate_transactions:
-            self._validate_transactions(df)
+            df = self._validate_transactions(df)
         return df
 
-    def get_categories(self) -> list[str]:
-        """Returns a idempptent list of categories"""
-        df = self.conn.sql(
+    def get_largest_transactions(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+        limit: int = 10,
+    ) -> pd.DataFrame:
+        """Returns the largest of the filtered transactions that aren't income.
+
+        Sorted and limited by duckdb, so only those rows are read into pandas.
+        """
+        params = self._filter_params(
+            start_date,
+            end_date,
+            account,
+            excluded_categories,
+            excluded_subcategories,
+        )
+        result = self._execute(
+            "get_largest_transactions",
             f"""
                 select
-                    distinct
-                    case
-                        when attributes.transactionType in ('{"','".join(INCOME_TYPES)}')
-                        then '{TransactionTypes.INCOME}'
-                        else relationships.parentCategory.data.id
-                    end as category
-                from transactions
+                    id,
+                    created_date,
+                    type,
+                    description,
+                    category,
+                    subcategory,
+                    abs(amount_cents) / 100 as amount,
+                    account,
+                    status
+                from named_transactions
                 where
-                    category is not null
+                    (year is null or {ARCHIVE_FILTERS}) and
+                    {TRANSACTION_FILTERS} and
+                    type != $income
                 order by
-                    category
-            """
-        ).df()
-        return df["category"].tolist()
+                    amount desc
+                limit $row_limit
+            """,
+            **params,
+            start_month=_month_key(params["start_date"]),
+            end_month=_month_key(params["end_date"]),
+            income=TransactionTypes.INCOME,
+            row_limit=limit,
+        )
+        return result.arrow().to_pandas(types_mapper=pd.ArrowDtype)
 
-    def get_subcategories(self) -> list[str]:
-        """Returns a idempptent list of subcategories"""
-        df = self.conn.sql(
+    def get_metrics(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+    ) -> dict:
+        """Returns the budget metrics for the filtered transactions.
+
+        The totals and the category and subcategory breakdowns of both income and
+        purchases are summed in a single pass over the daily totals, one grouping
+        set per level of the rollup, and the categories are named once summed.
+        """
+        result = self._execute(
+            "get_metrics",
             f"""
                 select
-                    distinct
-                    case
-                        when attributes.transactionType in ('{"','".join(INCOME_TYPES)}')
-                        then '{TransactionTypes.INCOME}'
-                        else relationships.parentCategory.data.id
-                    end as category,
-                    case
-                        when attributes.transactionType in ('{"','".join(INCOME_TYPES)}')
-                        then attributes.description
-                        else relationships.category.data.id
-                    end as subcategory
-                    --category ||': '|| _subcategory as subcategory
-                from transactions
-                where
-                    category is not null and
-                    subcategory is not null
+                    totals.type,
+                    coalesce(categories.name, totals.category) as category,
+                    coalesce(subcategories.name, totals.subcategory) as subcategory,
+                    totals.level,
+                    totals.amount
+                from (
+                    select
+                        type,
+                        category,
+                        subcategory,
+                        grouping(category, subcategory) as level,
+                        sum(amount_cents) / 100 as amount
+                    from daily_totals
+                    where {DAILY_TOTALS_FILTERS} and type in $types
+                    group by grouping sets (
+                        (type),
+                        (type, category),
+                        (type, subcategory),
+                        (type, category, subcategory)
+                    )
+                ) as totals
+                left join categories on categories.id = totals.category
+                left join subcategories on subcategories.id = totals.subcategory
+            """,
+            types=list(TransactionTypes),
+            **self._filter_params(
+                start_date,
+                end_date,
+                account,
+                excluded_categories,
+                excluded_subcategories,
+            ),
+        )
+        return metrics_from_rollup(result.df())
+
+    def get_rolling_trend(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+        window_days: int = 30,
+        types: list[str] = None,
+    ) -> pd.DataFrame:
+        """Returns the rolling sum of the filtered transactions by day and type.
+
+        The daily sums are joined onto a spine of every day and type in the period,
+        so days without transactions are filled with zero, and summed over a window
+        ending on each day. Days before the first full window have no amount.
+        """
+        result = self._execute(
+            "get_rolling_trend",
+            f"""
+                with
+                    daily as (
+                        select
+                            day,
+                            type,
+                            sum(amount_cents) / 100 as amount
+                        from daily_totals
+                        where {DAILY_TOTALS_FILTERS} and list_contains($types, type)
+                        group by all
+                    ),
+                    spine as (
+                        select
+                            days.day::date as day,
+                            types.type
+                        from
+                            generate_series(
+                                $start_date::timestamp,
+                                $end_date::timestamp,
+                                interval 1 day
+                            ) as days(day),
+                            (select unnest($types) as type) as types
+                    )
+                select
+                    spine.day,
+                    spine.type,
+                    case when spine.day >= $start_date + $window_days - 1 then
+                        sum(coalesce(daily.amount, 0)) over (
+                            partition by spine.type
+                            order by spine.day
+                            range between
+                                to_days(cast($window_days as integer) - 1) preceding
+                                and current row
+                        )
+                    end as amount
+                from spine
+                left join daily using (day, type)
                 order by
+                    spine.type,
+                    spine.day
+            """,
+            window_days=window_days,
+            types=list(types or TransactionTypes),
+            **self._filter_params(
+                start_date,
+                end_date,
+                account,
+                excluded_categories,
+                excluded_subcategories,
+            ),
+        )
+        # A small frame for charting, which plotly can't do with Arrow dates.
+        return result.df()
+
+    def get_period_spend(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+        period: BudgetPeriod = BudgetPeriod.MONTH,
+        group_by: str = "category",
+    ) -> dict:
+        """Returns the filtered transactions summed by period and group.
+
+        The daily totals are truncated to the start of their period, and each
+        group's mean over its periods is computed alongside the sums, in one query,
+        before the groups are named.
+        """
+        if group_by not in ("category", "subcategory"):
+            raise ValueError(f"Can't group spending by {group_by!r}")
+        part, shift_months = BudgetPeriod(period).truncation()
+        result = self._execute(
+            "get_period_spend",
+            f"""
+                select
+                    totals.period,
+                    coalesce(
+                        case
+                            when $group_by = 'subcategory' then subcategories.name
+                            else categories.name
+                        end,
+                        totals.spend_group
+                    ) as spend_group,
+                    totals.amount,
+                    avg(totals.amount) over (
+                        partition by totals.spend_group
+                    ) as mean_amount
+                from (
+                    select
+                        (
+                            date_trunc($part, day - to_months($shift_months)) +
+                            to_months($shift_months)
+                        )::date as period,
+                        case
+                            when $group_by = 'subcategory' then subcategory
+                            else category
+                        end as spend_group,
+                        sum(amount_cents) / 100 as amount
+                    from daily_totals
+                    where {DAILY_TOTALS_FILTERS}
+                    group by all
+                ) as totals
+                left join categories on categories.id = totals.spend_group
+                left join subcategories on subcategories.id = totals.spend_group
+                order by
+                    period,
+                    spend_group
+            """,
+            part=part,
+            shift_months=shift_months,
+            group_by=group_by,
+            **self._filter_params(
+                start_date,
+                end_date,
+                account,
+                excluded_categories,
+                excluded_subcategories,
+            ),
+        )
+        return period_spend_from_totals(result.df(), group_by)
+
+    def _filter_params(
+        self,
+        start_date: datetime,
+        end_date: datetime,
+        account: str = None,
+        excluded_categories: list[str] = None,
+        excluded_subcategories: list[str] = None,
+    ) -> dict:
+        """The parameters of the where clauses for the sidebar filters.
+
+        The names picked in the sidebar are looked up as the ids they filter by.
+        """
+        lookups = self._get_lookups()
+        return {
+            "start_date": _as_date(start_date),
+            "end_date": _as_date(end_date),
+            "accounts": _ids(lookups["accounts"], [account] if account else None),
+            "excluded_categories": _ids(
+                lookups["categories"], excluded_categories or []
+            ),
+            "excluded_subcategories": _ids(
+                lookups["subcategories"], excluded_subcategories or []
+            ),
+        }
+
+    def _execute(self, name: str, query: str, **params) -> duckdb.DuckDBPyConnection:
+        """Execute a query through a prepared statement, preparing it once.
+
+        duckdb parses and plans a prepared statement when it is created, so later
+        calls only bind the parameters and execute the plan. The duckdb python API
+        can't bind parameters to an `execute` statement, so they are passed as
+        escaped literals, which still lets duckdb prune row groups by date.
+        """
+        # Opening a new snapshot generation forgets the prepared statements, so
+        # the connection is only looked up once.
+        conn = self.conn
+        if name not in self._prepared:
+            conn.execute(f"prepare {name} as {query}")
+            self._prepared.add(name)
+        args = ", ".join(f"{k} := {_sql_literal(v)}" for k, v in params.items())
+        with timing.span(f"duckdb.{name}"):
+            return conn.execute(f"execute {name}({args})")
+
+    def get_categories(self) -> list[str]:
+        """Returns a idempptent list of categories"""
+        return list(self._get_lookups()["categories"])
+
+    def get_subcategories(self) -> list[str]:
+        """Returns a idempptent list of subcategories"""
+        return list(self._get_lookups()["subcategories"])
+
+    def get_accounts(self) -> list[str]:
+        """Returns the names of the transactional accounts, individual then joint,
+        then the ids of any accounts that aren't known yet."""
+        return list(self._get_lookups()["accounts"])
+
+    def _get_lookups(self) -> dict[str, dict[str, list[str]]]:
+        """Returns the ids of each name the sidebar filters by, in the order they
+        are listed, from the dimension tables.
+
+        They only change when the data does, so they are read once per generation
+        and kept in memory, shared by every cursor. The subcategories of income are
+        the payers, so they are read from the daily totals.
+        """
+        conn = self.conn
+        generation = (
+            self._conn_generation if self.store is not None else self.generation
+        )
+        lookups = self._shared.lookups
+        if lookups is not None and lookups[0] == generation:
+            return lookups[1]
+        categories = conn.execute(
+            """
+            select
+                name,
+                id
+            from categories
+            union all
+            select
+                $income,
+                $income
+            order by
+                name
+            """,
+            {"income": TransactionTypes.INCOME},
+        ).fetchall()
+        subcategories = conn.execute(
+            """
+            select
+                subcategory,
+                id
+            from (
+                select
+                    categories.name as category,
+                    subcategories.name as subcategory,
+                    subcategories.id
+                from subcategories
+                left join categories on categories.id = subcategories.category_id
+                union all
+                select distinct
                     category,
+                    subcategory,
                     subcategory
+                from daily_totals
+                where category = $income
+            )
+            where subcategory is not null
+            order by
+                min(category) over (partition by subcategory),
+                subcategory
+            """,
+            {"income": TransactionTypes.INCOME},
+        ).fetchall()
+        # Transactions of accounts that aren't known yet are named by their id.
+        accounts = conn.execute(
             """
-        ).df()
-        return df["subcategory"].tolist()
-
-    def get_accounts(self):
-        return ["UP", "2UP"]
+            select
+                name,
+                id
+            from (
+                select
+                    attributes.displayName as name,
+                    id,
+                    attributes.ownershipType as ownership_type,
+                    attributes.createdAt as created_at
+                from accounts
+                where attributes.accountType = $account_type
+                union all
+                select distinct
+                    account_id,
+                    account_id,
+                    null,
+                    null
+                from daily_totals
+                where account_id not in (select id from accounts)
+            )
+            order by
+                ownership_type nulls last,
+                created_at,
+                name
+            """,
+            {"account_type": BUDGET_ACCOUNT_TYPE},
+        ).fetchall()
+        lookups = {
+            "categories": _ids_by_name(categories),
+            "subcategories": _ids_by_name(subcategories),
+            "accounts": _ids_by_name(accounts),
+        }
+        self._shared.lookups = (generation, lookups)
+        return lookups
 
     def get_account_balances(self):
         return self.conn.sql(
@@ -329,60 +1960,33 @@ class BudgetDataUp:
             """
         ).df()
 
-    def _validate_transactions(self, df) -> None:
-        # validate transactions
-        return TransactionSchema.parse_df(
-            dataframe=df,
-            errors="filter",  # raise, filter
-        )
+    def _validate_transactions(self, df) -> pd.DataFrame:
+        # Transactions are validated as they are loaded in ValidationMode.INGEST.
+        if self.validation in (ValidationMode.OFF, ValidationMode.INGEST):
+            return df
+        with timing.span("upbank.validate_transactions", rows_in=len(df)) as span:
+            df = TransactionSchema.validate_df(
+                df,
+                errors="filter",
+                sample_size=(
+                    VALIDATION_SAMPLE_SIZE
+                    if self.validation == ValidationMode.SAMPLE
+                    else None
+                ),
+            )
+            span.rows_out = len(df)
+        return df
 
 
 if __name__ == "__main__":
     with duckdb.connect("./db/db.duckdb") as conn:
         print(
             conn.sql(
-                f"""
-                select
-                        id,
-                        attributes.createdAt as created_date,
-                        attributes.description as description,
-                        case
-                            when attributes.transactionType in ('{"','".join(INCOME_TYPES)}')
-                            then '{TransactionTypes.INCOME}'
-                            when attributes.transactionType in ('{"','".join(EXPENSE_TYPES)}')
-                            then '{TransactionTypes.PURCHASE}'
-                        end as type,
-                        relationships.parentCategory.data.id parentCategory,
-                        relationships.category.data.id as subcategory,
-                        attributes.amount.value as amount,
-                        attributes.status as status,
-                        relationships.account.data.id as account_id,
-                        case
-                            when account_id = '{UP_ACCOUNT_ID}'
-                            then 'UP'
-                            when account_id = '{TWOUP_ACCOUNT_ID}'
-                            then '2UP'
-                        end as account
-                    from transactions
-                    where (
-                        type is not null or
-                        attributes.transactionType in ('{"','".join(INCOME_TYPES)}')
-                    )
+                """
+                select *
+                from transactions
+                order by
+                    created_date desc
             """
             )
         )
-
-        # print(
-        #     conn.sql(
-        #         """
-        #         select
-        #             attributes.createdAt as created_ts,
-        #             attributes.displayName as display_name,
-        #             attributes.accountType as account_type,
-        #             attributes.ownershipType as ownership_type,
-        #             cast(attributes.balance.value as DECIMAL) as balance
-        #             cast(attributes.balance.valueInBaseUnits as DECIMAL) as balance_base_units
-        #         from accounts
-        #     """
-        #     )
-        # )
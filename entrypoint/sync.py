@@ -0,0 +1,156 @@
+"""Background sync.
+
+Refresh the budget data on a worker thread, on a schedule and on request, so a
+sync never blocks a Streamlit rerun.
+"""
+
+import copy
+import datetime
+import threading
+import time
+from dataclasses import dataclass, field
+from enum import StrEnum
+
+from config import BudgetData
+
+
+class SyncTask(StrEnum):
+    TRANSACTIONS = "transactions"
+    FULL_REFRESH = "full_refresh"
+    ACCOUNTS = "accounts"
+
+
+class SyncState(StrEnum):
+    IDLE = "idle"
+    RUNNING = "running"
+    FAILED = "failed"
+
+
+@dataclass
+class SyncStatus:
+    """What the sync worker is doing, and how its last sync went."""
+
+    state: SyncState = SyncState.IDLE
+    # The running task, and the transactions it has loaded so far.
+    task: SyncTask | None = None
+    started_at: datetime.datetime | None = None
+    rows_loaded: int = 0
+    queued: list[SyncTask] = field(default_factory=list)
+    next_scheduled_at: datetime.datetime | None = None
+    # The last task to finish, successfully or not.
+    last_task: SyncTask | None = None
+    last_sync_at: datetime.datetime | None = None
+    last_rows: int | None = None
+    last_seconds: float | None = None
+    last_error: str | None = None
+
+
+class SyncWorker:
+    """Run the refreshes of a data source on a background thread.
+
+    Syncs are queued, by `enqueue` or every `interval`, and run one at a time on
+    the worker's own cursor. Sources swap the refreshed data in when a refresh
+    finishes, so sessions keep reading the previous data until then, and their
+    caches are emptied by the change of `generation`.
+    """
+
+    def __init__(self, budget_data: BudgetData, interval: datetime.timedelta | None = None):
+        """
+        budget_data: BudgetData: the data source to refresh.
+        interval: datetime.timedelta | None: time between scheduled syncs of the
+            transactions, from the end of the last sync; or None not to schedule.
+        """
+        self.budget_data = budget_data.cursor()
+        self.interval = interval
+        self._status = SyncStatus()
+        self._condition = threading.Condition()
+        self._next_scheduled = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="sync", daemon=True)
+
+    def start(self) -> "SyncWorker":
+        """Start the worker thread, scheduling the first sync an interval away."""
+        with self._condition:
+            self._schedule_next()
+        self._thread.start()
+        return self
+
+    def close(self, timeout: float | None = None) -> None:
+        """Stop the worker, waiting for a running sync to finish."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def enqueue(self, task: SyncTask) -> bool:
+        """Queue a sync, returning False if the same sync is already queued."""
+        with self._condition:
+            if task in self._status.queued:
+                return False
+            self._status.queued.append(task)
+            self._condition.notify()
+        return True
+
+    @property
+    def status(self) -> SyncStatus:
+        """A copy of the worker's status."""
+        with self._condition:
+            return copy.deepcopy(self._status)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._closed and not self._status.queued:
+                    if self._next_scheduled is None:
+                        self._condition.wait()
+                        continue
+                    wait = self._next_scheduled - time.monotonic()
+                    if wait <= 0:
+                        self._status.queued.append(SyncTask.TRANSACTIONS)
+                        break
+                    self._condition.wait(wait)
+                if self._closed:
+                    return
+                task = self._status.queued.pop(0)
+                self._status.state = SyncState.RUNNING
+                self._status.task = task
+                self._status.started_at = _now()
+                self._status.rows_loaded = 0
+            started = time.perf_counter()
+            error = None
+            rows = None
+            try:
+                rows = self._sync(task)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            with self._condition:
+                self._status.state = SyncState.FAILED if error else SyncState.IDLE
+                self._status.task = None
+                self._status.last_task = task
+                self._status.last_sync_at = _now()
+                self._status.last_rows = rows
+                self._status.last_seconds = time.perf_counter() - started
+                self._status.last_error = error
+                self._schedule_next()
+
+    def _sync(self, task: SyncTask) -> int | None:
+        """Run a sync, returning the number of transactions it loaded."""
+        if task == SyncTask.ACCOUNTS:
+            self.budget_data.refresh_accounts()
+            return None
+        return self.budget_data.refresh_transactions(full_refresh=task == SyncTask.FULL_REFRESH, progress=self._progress)
+
+    def _progress(self, rows_loaded: int) -> None:
+        with self._condition:
+            self._status.rows_loaded = rows_loaded
+
+    def _schedule_next(self) -> None:
+        if self.interval is None:
+            return
+        self._next_scheduled = time.monotonic() + self.interval.total_seconds()
+        self._status.next_scheduled_at = _now() + self.interval
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now().astimezone()
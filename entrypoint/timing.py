@@ -0,0 +1,174 @@
+"""Timing spans.
+
+Time the data source calls and page sections of each Streamlit rerun, counting the
+rows going in and out of each, to find where a slow rerun spent its time.
+"""
+
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+import pandas as pd
+from config import BudgetData
+
+
+@dataclass
+class Span:
+    """A timed section of a rerun."""
+
+    name: str
+    # Seconds since the start of the rerun.
+    start: float = 0.0
+    seconds: float = 0.0
+    # Nesting depth, 0 for the outermost spans.
+    depth: int = 0
+    rows_in: int | None = None
+    rows_out: int | None = None
+
+
+# Returned by `span` when timing is off, so an untimed section costs a lookup.
+_NO_SPAN = nullcontext(Span("off"))
+_tracer: ContextVar["Tracer | None"] = ContextVar("tracer", default=None)
+_log_lock = threading.Lock()
+
+
+class Tracer:
+    """Collect the spans of one rerun.
+
+    Spans are only recorded while the tracer is active, in the thread or context
+    that activated it, which is the script thread of one Streamlit session.
+    """
+
+    def __init__(self, log_path: str | Path | None = None):
+        """
+        log_path: str | Path | None: JSON lines file each rerun's spans are
+            appended to when the tracer is finished; or None not to log them.
+        """
+        self.log_path = Path(log_path) if log_path else None
+        self.spans: list[Span] = []
+        self._started = 0.0
+        self._depth = 0
+        self._token = None
+
+    def activate(self) -> "Tracer":
+        """Start recording a rerun, discarding the spans of the last one."""
+        self.spans = []
+        self._started = time.perf_counter()
+        self._depth = 0
+        self._token = _tracer.set(self)
+        return self
+
+    def finish(self) -> None:
+        """Stop recording, and append the rerun's spans to the log."""
+        if self._token is not None:
+            _tracer.reset(self._token)
+            self._token = None
+        if self.log_path is None or not self.spans:
+            return
+        rerun = {"rerun_at": time.time() - (time.perf_counter() - self._started)}
+        lines = "".join(json.dumps({**rerun, **asdict(s)}) + "\n" for s in self.spans)
+        with _log_lock, self.log_path.open("a") as log:
+            log.write(lines)
+
+    @contextmanager
+    def span(self, name: str, rows_in: int | None = None):
+        span = Span(
+            name,
+            start=time.perf_counter() - self._started,
+            depth=self._depth,
+            rows_in=rows_in,
+        )
+        self.spans.append(span)
+        self._depth += 1
+        try:
+            yield span
+        finally:
+            self._depth -= 1
+            span.seconds = time.perf_counter() - self._started - span.start
+
+    def to_frame(self) -> pd.DataFrame:
+        """The spans of the rerun, indented by depth, in the order they started."""
+        return pd.DataFrame(
+            {
+                "span": ["  " * s.depth + s.name for s in self.spans],
+                "ms": [s.seconds * 1000 for s in self.spans],
+                "rows in": pd.array([s.rows_in for s in self.spans], dtype="Int64"),
+                "rows out": pd.array([s.rows_out for s in self.spans], dtype="Int64"),
+            }
+        )
+
+
+def span(name: str, rows_in: int | None = None):
+    """Time a section of the rerun, if a tracer is active.
+
+    Yields the `Span`, so the section can set the rows it produced:
+
+        with timing.span("listing", rows_in=len(df)) as span:
+            ...
+            span.rows_out = len(listed)
+    """
+    tracer = _tracer.get()
+    if tracer is None:
+        return _NO_SPAN
+    return tracer.span(name, rows_in)
+
+
+def timed(name: str, rows_arg: int = 0):
+    """Decorate a function to time its calls, if a tracer is active.
+
+    The rows in are counted from the positional argument at `rows_arg`, and the
+    rows out from the return value.
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer.get() is None:
+                return function(*args, **kwargs)
+            rows_in = count_rows(args[rows_arg]) if len(args) > rows_arg else None
+            with span(name, rows_in) as s:
+                result = function(*args, **kwargs)
+                s.rows_out = count_rows(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def count_rows(value: Any) -> int | None:
+    """The number of rows in a frame, series or list, or in the values of a dict."""
+    if isinstance(value, pd.DataFrame | pd.Series | list | tuple):
+        return len(value)
+    if isinstance(value, dict):
+        counts = [count_rows(v) for v in value.values()]
+        counts = [c for c in counts if c is not None]
+        return sum(counts) if counts else len(value)
+    return None
+
+
+class TimedBudgetData:
+    """Wrap a `BudgetData` source and time every call of its methods."""
+
+    def __init__(self, budget_data: BudgetData):
+        self.budget_data = budget_data
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self.budget_data, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def timed_method(*args, **kwargs):
+            with span(f"budget_data.{name}") as s:
+                result = attr(*args, **kwargs)
+                s.rows_out = count_rows(result)
+                return result
+
+        return timed_method
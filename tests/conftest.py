@@ -0,0 +1,27 @@
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from sources.upbank import BudgetDataUp, UpbankClient
+from upbank_stub import UpStub
+
+
+@pytest.fixture
+def stub() -> Iterator[UpStub]:
+    """A local Up API serving a year of synthesized transactions."""
+    with UpStub(500) as stub:
+        yield stub
+
+
+@pytest.fixture
+def client(stub: UpStub) -> Iterator[UpbankClient]:
+    with UpbankClient("token", base_url=stub.url) as client:
+        yield client
+
+
+@pytest.fixture
+def budget_data(client: UpbankClient, tmp_path: Path) -> Iterator[BudgetDataUp]:
+    """An Up source on a new database file."""
+    budget_data = BudgetDataUp(client, tmp_path / "db.duckdb")
+    yield budget_data
+    budget_data.close()
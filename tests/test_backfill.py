@@ -0,0 +1,55 @@
+import datetime
+from pathlib import Path
+
+import pytest
+from sources.snapshots import SnapshotStore
+from sources.upbank import HIST_DATA_LOAD_DAYS, BudgetDataUp, UpbankClient
+
+SINCE = datetime.date.today() - datetime.timedelta(days=2 * HIST_DATA_LOAD_DAYS)
+FILTERS = {"start_date": datetime.date(2000, 1, 1), "end_date": datetime.date.today()}
+
+
+@pytest.fixture
+def stub(stub):
+    """The stub with another two years of transactions, half older than a sync loads."""
+    stub.add_transactions(500, days=2 * HIST_DATA_LOAD_DAYS - 10)
+    return stub
+
+
+@pytest.fixture
+def snapshot_budget_data(client: UpbankClient, tmp_path: Path):
+    """An Up source on a snapshot store, archiving the months that ended over 30 days ago."""
+    budget_data = BudgetDataUp(client, SnapshotStore(tmp_path / "snapshots"), archive_directory=tmp_path / "archive", archive_after_days=30)
+    yield budget_data
+    budget_data.close()
+
+
+def test_backfill_loads_the_history_before_the_sync(stub, budget_data):
+    budget_data.refresh_transactions()
+    chunks = list(budget_data.backfill(SINCE, chunk_days=60))
+    assert chunks[-1].since.date() == SINCE
+    assert all(newer.since == older.until for newer, older in zip(chunks, chunks[1:], strict=False))
+    assert sum(chunk.transactions for chunk in chunks) > 0
+    assert len(budget_data.get_transactions(**FILTERS)) == len(stub.transactions)
+
+
+def test_interrupted_backfill_resumes_from_its_checkpoint(stub, budget_data):
+    budget_data.refresh_transactions()
+    backfill = budget_data.backfill(SINCE, chunk_days=60)
+    first = next(backfill)
+    backfill.close()
+    assert budget_data._get_backfill_checkpoint() == first.since
+
+    chunks = list(budget_data.backfill(SINCE, chunk_days=60))
+    assert chunks[0].until == first.since
+    assert budget_data._get_backfill_checkpoint().date() == SINCE
+    assert len(budget_data.get_transactions(**FILTERS)) == len(stub.transactions)
+    assert list(budget_data.backfill(SINCE, chunk_days=60)) == []
+
+
+def test_backfill_swaps_in_a_generation_per_chunk(stub, snapshot_budget_data):
+    snapshot_budget_data.refresh_transactions()
+    generation = snapshot_budget_data.generation
+    chunks = list(snapshot_budget_data.backfill(SINCE, chunk_days=120))
+    assert snapshot_budget_data.generation == generation + len(chunks)
+    assert len(snapshot_budget_data.get_transactions(**FILTERS)) == len(stub.transactions)
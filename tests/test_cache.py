@@ -0,0 +1,78 @@
+import datetime
+
+import pandas as pd
+from cache import CachedBudgetData
+
+FILTERS = {"start_date": datetime.date(2024, 1, 1), "end_date": datetime.date(2024, 12, 31)}
+
+
+class CountingBudgetData:
+    """A source that counts the queries it runs."""
+
+    def __init__(self):
+        self.generation = 0
+        self.calls = 0
+
+    def get_transactions(self, start_date, end_date, account=None, excluded_categories=None, excluded_subcategories=None, validate_transactions=True):
+        self.calls += 1
+        return pd.DataFrame({"generation": [self.generation], "account": [account]})
+
+    def get_categories(self):
+        self.calls += 1
+        return ["Good Life", "Home"]
+
+
+def test_repeated_query_is_served_from_cache():
+    source = CountingBudgetData()
+    cached = CachedBudgetData(source)
+    first = cached.get_transactions(**FILTERS)
+    assert cached.get_transactions(**FILTERS) is first
+    assert source.calls == 1
+    assert (cached.stats.hits, cached.stats.misses, cached.stats.entries) == (1, 1, 1)
+
+
+def test_excluded_filters_are_normalized():
+    source = CountingBudgetData()
+    cached = CachedBudgetData(source)
+    cached.get_transactions(**FILTERS, excluded_categories=["Home", "Good Life"])
+    cached.get_transactions(**FILTERS, excluded_categories=["Good Life", "Home"])
+    cached.get_transactions(**FILTERS, account="Spending")
+    assert source.calls == 2
+
+
+def test_new_generation_empties_cache():
+    source = CountingBudgetData()
+    cached = CachedBudgetData(source)
+    cached.get_transactions(**FILTERS)
+    cached.get_categories()
+    source.generation += 1
+    assert cached.get_transactions(**FILTERS)["generation"].iloc[0] == 1
+    assert source.calls == 3
+    assert cached.stats.entries == 1
+
+
+def test_result_loaded_during_refresh_is_not_kept():
+    source = CountingBudgetData()
+    cached = CachedBudgetData(source)
+    get_categories = source.get_categories
+
+    def refreshed_while_loading():
+        source.generation += 1
+        return get_categories()
+
+    source.get_categories = refreshed_while_loading
+    cached.get_categories()
+    assert cached.stats.entries == 0
+
+
+def test_least_recently_used_is_evicted():
+    source = CountingBudgetData()
+    cached = CachedBudgetData(source, max_entries=2)
+    for account in ["Spending", "2Up Spending", "Spending", "Saver"]:
+        cached.get_transactions(**FILTERS, account=account)
+    assert source.calls == 3
+    assert cached.stats.evictions == 1
+    cached.get_transactions(**FILTERS, account="Spending")
+    assert source.calls == 3
+    cached.get_transactions(**FILTERS, account="2Up Spending")
+    assert source.calls == 4
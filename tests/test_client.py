@@ -0,0 +1,22 @@
+import time
+
+from sources.upbank import RATE_LIMIT_PAUSE_SECONDS, RATE_LIMIT_RESERVE, UpbankClient
+from upbank_stub import UpStub
+
+
+def test_client_pauses_before_the_rate_limit_is_reached():
+    with UpStub(0, rate_limit=RATE_LIMIT_RESERVE * 2) as stub, UpbankClient("token", base_url=stub.url) as client:
+        started = time.monotonic()
+        for _ in range(RATE_LIMIT_RESERVE * 4):
+            client.ping()
+        assert stub.throttled == 0
+        assert client.stats.retries == 0
+        assert client.stats.rate_limit_pauses > 0
+        assert time.monotonic() - started >= RATE_LIMIT_PAUSE_SECONDS
+
+
+def test_client_without_rate_limit_headers_doesnt_pause(client):
+    for _ in range(RATE_LIMIT_RESERVE * 4):
+        client.ping()
+    assert client.stats.rate_limit_pauses == 0
+    assert client.stats.rate_limit_remaining is None
@@ -0,0 +1,37 @@
+import gc
+
+import duckdb
+import pytest
+from sources.snapshots import SnapshotStore
+from sources.upbank import BudgetDataUp
+
+
+def test_closing_the_source_closes_its_cursors(budget_data):
+    cursor = budget_data.cursor()
+    nested = cursor.cursor()
+    budget_data.close()
+    for handle in (cursor, nested):
+        with pytest.raises(duckdb.ConnectionException):
+            handle.conn.sql("select 1")
+
+
+def test_closing_a_cursor_leaves_the_source_open(budget_data):
+    cursor = budget_data.cursor()
+    cursor.close()
+    assert budget_data.conn.sql("select 1").fetchone() == (1,)
+
+
+def test_dropped_cursors_are_forgotten(budget_data):
+    budget_data.cursor()
+    gc.collect()
+    assert len(budget_data._cursors) == 0
+
+
+def test_closing_a_snapshot_source_closes_its_readers(stub, client, tmp_path):
+    budget_data = BudgetDataUp(client, SnapshotStore(tmp_path))
+    budget_data.refresh_transactions()
+    cursor = budget_data.cursor()
+    assert cursor.get_accounts()
+    budget_data.close()
+    with pytest.raises(duckdb.ConnectionException):
+        cursor.conn.sql("select 1")
@@ -0,0 +1,78 @@
+import datetime
+from pathlib import Path
+
+import duckdb
+import pytest
+from metrics import calculate_budget_metrics
+from sources.upbank import BudgetDataUp, UpbankClient
+
+FILTERS = {"start_date": datetime.date(2000, 1, 1), "end_date": datetime.date.today()}
+
+
+def summed_transactions(budget_data: BudgetDataUp) -> list[tuple]:
+    """The daily totals summed from the hot and archived transactions."""
+    return budget_data.conn.sql(
+        """
+        select created_date::date, type, category, subcategory, account_id, sum(abs(amount_cents))::bigint
+        from (
+            select created_date, type, category, subcategory, account_id, amount_cents from transactions
+            union all
+            select created_date, type, category, subcategory, account_id, amount_cents from archived_transactions
+        )
+        group by all
+        order by all
+        """
+    ).fetchall()
+
+
+def daily_totals(budget_data: BudgetDataUp) -> list[tuple]:
+    return budget_data.conn.sql("from daily_totals order by all").fetchall()
+
+
+@pytest.fixture
+def archiving_budget_data(client: UpbankClient, tmp_path: Path):
+    """An Up source archiving the months that ended over 30 days ago."""
+    budget_data = BudgetDataUp(client, tmp_path / "db.duckdb", archive_directory=tmp_path / "archive", archive_after_days=30)
+    yield budget_data
+    budget_data.close()
+
+
+def test_rollup_equals_transactions_after_each_sync(stub, budget_data):
+    budget_data.refresh_transactions()
+    assert daily_totals(budget_data) == summed_transactions(budget_data)
+
+    stub.add_transactions(20)
+    newest = max(stub.transactions, key=lambda t: t["attributes"]["createdAt"])
+    newest["attributes"]["amount"]["valueInBaseUnits"] -= 1000
+    budget_data.refresh_transactions()
+    assert daily_totals(budget_data) == summed_transactions(budget_data)
+
+    budget_data.refresh_transactions(full_refresh=True)
+    assert daily_totals(budget_data) == summed_transactions(budget_data)
+
+
+def test_rollup_includes_archived_transactions(archiving_budget_data):
+    archiving_budget_data.refresh_transactions()
+    assert archiving_budget_data.conn.sql("select count(*) from archived_transactions").fetchone()[0] > 0
+    assert daily_totals(archiving_budget_data) == summed_transactions(archiving_budget_data)
+
+
+def test_metrics_from_rollup_equal_metrics_from_transactions(budget_data):
+    budget_data.refresh_transactions()
+    expected = calculate_budget_metrics(budget_data.get_transactions(**FILTERS))
+    metrics = budget_data.get_metrics(**FILTERS)
+    assert metrics["total_income"] == pytest.approx(expected["total_income"])
+    assert metrics["total_spending"] == pytest.approx(expected["total_spending"])
+    assert metrics["spending_by_category"].to_dict() == pytest.approx(expected["spending_by_category"].to_dict())
+
+
+def test_legacy_transactions_table_is_reset(stub, client, tmp_path):
+    """A database from before the flat transactions table opens, and syncs in full."""
+    path = tmp_path / "db.duckdb"
+    with duckdb.connect(path) as conn:
+        conn.sql("create table transactions as select 'transactions' as type, 'id' as id, {'createdAt': '2024-01-01'} as attributes")
+    budget_data = BudgetDataUp(client, path)
+    assert daily_totals(budget_data) == []
+    assert budget_data.refresh_transactions() == len(stub.transactions)
+    assert daily_totals(budget_data) == summed_transactions(budget_data)
+    budget_data.close()
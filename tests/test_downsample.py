@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from downsample import DownsampleMethod, downsample, lttb, min_max
+
+
+@pytest.fixture
+def line() -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(0)
+    x = np.arange(10_000)
+    return x, np.cumsum(rng.normal(size=len(x)))
+
+
+@pytest.mark.parametrize("points", [3, 10, 500])
+def test_lttb_keeps_endpoints_within_threshold(line, points):
+    x, y = line
+    picked = lttb(x, y, points)
+    assert len(picked) == points
+    assert picked[0] == 0 and picked[-1] == len(x) - 1
+    assert np.all(np.diff(picked) > 0)
+
+
+def test_lttb_keeps_a_spike(line):
+    x, y = line
+    y = y.copy()
+    y[4321] = y.max() + 1_000
+    assert 4321 in lttb(x, y, 100)
+
+
+def test_lttb_accepts_datetimes(line):
+    _, y = line
+    x = pd.date_range("2020-01-01", periods=len(y), freq="D").to_numpy()
+    picked = lttb(x, y, 50)
+    assert len(picked) == 50 and picked[-1] == len(y) - 1
+
+
+def test_short_lines_are_kept_whole(line):
+    x, y = line
+    assert np.array_equal(lttb(x[:20], y[:20], 50), np.arange(20))
+    assert np.array_equal(min_max(y[:20], 50), np.arange(20))
+
+
+def test_min_max_keeps_extremes_within_threshold(line):
+    _, y = line
+    picked = min_max(y, 100)
+    assert len(picked) <= 100
+    assert {int(np.argmin(y)), int(np.argmax(y))} <= set(picked.tolist())
+
+
+@pytest.mark.parametrize("method", list(DownsampleMethod))
+def test_downsample_each_line(line, method):
+    x, y = line
+    df = pd.DataFrame({"day": np.tile(x, 2), "amount": np.concatenate([y, -y]), "type": ["Income"] * len(x) + ["Purchase"] * len(x)})
+    df.loc[5, "amount"] = np.nan
+    result = downsample(df, "day", "amount", "type", 200, method)
+    assert result.groupby("type").size().le(200).all()
+    assert set(result["type"]) == {"Income", "Purchase"}
+    assert result["amount"].notna().all()
+    assert result.equals(df.loc[result.index])
@@ -0,0 +1,89 @@
+import duckdb
+import pytest
+from sources.snapshots import KEEP_GENERATIONS, SnapshotStore, UnchangedGeneration, WriterBusyError
+from sources.upbank import BudgetDataUp
+
+
+def write_value(store: SnapshotStore, value: int) -> None:
+    with store.write() as conn:
+        conn.sql("create or replace table t (value integer)")
+        conn.execute("insert into t values (?)", [value])
+
+
+def read_value(conn: duckdb.DuckDBPyConnection) -> int:
+    return conn.sql("select value from t").fetchone()[0]
+
+
+def test_write_swaps_in_next_generation(tmp_path):
+    store = SnapshotStore(tmp_path)
+    assert store.generation == 0
+    write_value(store, 1)
+    generation, conn = store.connect()
+    assert generation == store.generation == 1
+    assert read_value(conn) == 1
+
+
+def test_reader_keeps_its_generation_while_writer_swaps(tmp_path):
+    store = SnapshotStore(tmp_path)
+    write_value(store, 1)
+    _, reader = store.connect()
+    write_value(store, 2)
+    assert read_value(reader) == 1
+    _, conn = store.connect()
+    assert read_value(conn) == 2
+
+
+def test_failed_write_is_discarded(tmp_path):
+    store = SnapshotStore(tmp_path)
+    write_value(store, 1)
+    with pytest.raises(RuntimeError), store.write() as conn:
+        conn.sql("delete from t")
+        raise RuntimeError("sync failed")
+    assert store.generation == 1
+    assert not store.path(2).exists()
+    assert read_value(store.connect()[1]) == 1
+
+
+def test_unchanged_write_is_discarded(tmp_path):
+    store = SnapshotStore(tmp_path)
+    write_value(store, 1)
+    with store.write():
+        raise UnchangedGeneration
+    assert store.generation == 1
+    assert not store.path(2).exists()
+
+
+def test_old_generations_are_pruned(tmp_path):
+    store = SnapshotStore(tmp_path)
+    for value in range(KEEP_GENERATIONS + 2):
+        write_value(store, value)
+    kept = sorted(path.name for path in tmp_path.glob("gen-*.duckdb"))
+    assert kept == [store.path(store.generation - i).name for i in reversed(range(KEEP_GENERATIONS))]
+
+
+def test_one_writer_at_a_time(tmp_path):
+    store = SnapshotStore(tmp_path)
+    with store.write(), pytest.raises(WriterBusyError), store.write(block=False):
+        pass
+
+
+def test_initial_database_is_first_generation(tmp_path):
+    initial = tmp_path / "db.duckdb"
+    with duckdb.connect(initial) as conn:
+        conn.sql("create table t as select 42 as value")
+    store = SnapshotStore(tmp_path / "snapshots", initial=initial)
+    assert store.generation == 1
+    assert read_value(store.connect()[1]) == 42
+
+
+def test_sync_only_swaps_in_changes(stub, client, tmp_path):
+    budget_data = BudgetDataUp(client, SnapshotStore(tmp_path))
+    budget_data.refresh_transactions()
+    generation = budget_data.generation
+    budget_data.refresh_transactions()
+    budget_data.refresh_accounts()
+    assert budget_data.generation == generation
+    stub.add_transactions(5)
+    budget_data.refresh_transactions()
+    assert budget_data.generation == generation + 1
+    budget_data.close()
@@ -0,0 +1,65 @@
+import datetime
+
+from sources.upbank import BudgetDataUp
+from upbank_stub import UpStub
+
+
+def newest(stub: UpStub) -> dict:
+    return max(stub.transactions, key=lambda t: t["attributes"]["createdAt"])
+
+
+def stored(budget_data: BudgetDataUp, transaction_id: str) -> list[tuple]:
+    return budget_data.conn.execute("select description, amount_cents from transactions where id = ?", [transaction_id]).fetchall()
+
+
+def test_incremental_sync_is_idempotent(stub, budget_data):
+    assert budget_data.refresh_transactions() == len(stub.transactions)
+    for _ in range(2):
+        assert 0 < budget_data.refresh_transactions() < len(stub.transactions)
+    rows, ids = budget_data.conn.sql("select count(*), count(distinct id) from transactions").fetchone()
+    assert rows == ids == len(stub.transactions)
+
+
+def test_incremental_sync_loads_new_transactions(stub, budget_data):
+    budget_data.refresh_transactions()
+    stub.add_transactions(20)
+    budget_data.refresh_transactions()
+    assert budget_data.conn.sql("select count(*) from transactions").fetchone()[0] == len(stub.transactions)
+
+
+def test_sync_updates_changed_transaction_in_overlap(stub, budget_data):
+    budget_data.refresh_transactions()
+    transaction = newest(stub)
+    transaction["attributes"]["description"] = "Renamed merchant"
+    transaction["attributes"]["amount"]["valueInBaseUnits"] -= 1000
+    budget_data.refresh_transactions()
+    cents = transaction["attributes"]["amount"]["valueInBaseUnits"]
+    assert stored(budget_data, transaction["id"]) == [("Renamed merchant", cents)]
+    assert budget_data.conn.sql("select count(*) from transactions").fetchone()[0] == len(stub.transactions)
+
+
+def test_sync_skips_held_transactions(stub, budget_data):
+    budget_data.refresh_transactions()
+    stub.add_transactions(20, status="HELD")
+    budget_data.refresh_transactions()
+    budget_data.refresh_transactions(full_refresh=True)
+    settled = sum(t["attributes"]["status"] == "SETTLED" for t in stub.transactions)
+    assert budget_data.conn.sql("select count(*) from transactions").fetchone()[0] == settled
+
+
+def test_sync_moves_watermarks_to_newest_transaction(stub, budget_data):
+    budget_data.refresh_transactions()
+    newest_by_account = {}
+    for transaction in stub.transactions:
+        account_id = transaction["relationships"]["account"]["data"]["id"]
+        created_at = datetime.datetime.fromisoformat(transaction["attributes"]["createdAt"])
+        newest_by_account[account_id] = max(created_at, newest_by_account.get(account_id, created_at))
+    assert budget_data._get_watermarks() == newest_by_account
+
+
+def test_full_refresh_keeps_watermarks(stub, budget_data):
+    budget_data.refresh_transactions()
+    watermarks = budget_data._get_watermarks()
+    assert budget_data.refresh_transactions(full_refresh=True) == len(stub.transactions)
+    assert budget_data._get_watermarks() == watermarks
+    assert budget_data.refresh_transactions() < len(stub.transactions)